@@ -0,0 +1,188 @@
+# bench/bench_cycle.py
+"""
+Offline benchmark of the full poll -> detect -> deliver cycle against the
+local mock server (bench/mock_server.py, started as a subprocess so its
+memory doesn't count towards ours). Run from the repo root:
+
+    python -m bench.bench_cycle --batches 500 --known-ids 100000 --cycles 5
+
+Reports cycle latency, detection and delivery throughput, request counts
+per cycle and peak RSS. Use --json to get machine-readable output for
+comparing runs.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import shutil
+import resource
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+
+from bench.mock_server import add_arguments, batch_id, announcement_id
+
+
+def start_mock_subprocess(args):
+    cmd = [
+        sys.executable, "-m", "bench.mock_server", "--port", "0",
+        "--batches", str(args.batches),
+        "--per-batch", str(args.per_batch),
+        "--page-size", str(args.page_size),
+        "--api-latency", str(args.api_latency),
+        "--sink-latency", str(args.sink_latency),
+        "--rate-429", str(args.rate_429),
+        "--fail-rate", str(args.fail_rate),
+        "--discord-limit", str(args.discord_limit),
+        "--api-fail-rate", str(args.api_fail_rate),
+    ]
+    if args.etag:
+        cmd.append("--etag")
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    url = proc.stdout.readline().strip()
+    if not url:
+        proc.kill()
+        raise RuntimeError("mock server did not start")
+    return proc, url
+
+def mock_call(url, path, method="GET"):
+    req = urllib.request.Request(url + path, method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(req) as resp:
+        return json.loads(resp.read() or b"null")
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def seed_store(store, args):
+    """Marks every announcement the mock already has as known, padded with filler IDs up to --known-ids."""
+    from core.models import Announcement
+    rows = []
+    for b in range(args.batches):
+        bid = batch_id(b)
+        for i in range(1, args.per_batch + 1):
+            rows.append(Announcement(announcement_id(bid, i), None, None, batch_id=bid))
+    for i in range(max(0, args.known_ids - len(rows))):
+        rows.append(Announcement(f"filler{i:08d}", None, None))
+    for start in range(0, len(rows), 10000):
+        store.add_announcements(rows[start:start + 10000])
+    return len(rows)
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    idx = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[idx]
+
+def run(args):
+    proc, url = start_mock_subprocess(args)
+    workdir = tempfile.mkdtemp(prefix="pw-bench-")
+    try:
+        # Must be set before core/ is imported, which reads them at import time
+        os.environ["PW_API_BASE_URL"] = url
+        os.environ["PW_TELEGRAM_API_URL"] = url
+        os.environ["PW_LOGO_URL"] = url + "/static/logo.png"
+        from core.http import configure_session
+        from core.scheduler import BatchScheduler
+        from core.poller import Account, Poller
+        from core.metrics import HTTP_REQUESTS
+
+        config_path = os.path.join(workdir, "config.json")
+        cfg = {
+            "name": "bench",
+            "token": "bench-token",
+            "ids_file": "known.db",
+            "selected_batch_ids": [batch_id(b) for b in range(args.batches)],
+        }
+        if args.sink in ("discord", "both"):
+            cfg["webhook_url"] = url + "/webhook/bench"
+        if args.sink in ("telegram", "both"):
+            cfg["telegram_bot_token"] = "bench"
+            cfg["telegram_chat_id"] = "1"
+        with open(config_path, "w") as f:
+            json.dump(cfg, f)
+
+        configure_session(args.concurrency)
+        account = Account(config_path)
+        seeded = seed_store(account.known_ids, args)
+        scheduler = BatchScheduler(30 * 60)
+        poller = Poller([account], scheduler, concurrency=args.concurrency, max_pages=args.max_pages)
+        poller.start()
+
+        t0 = time.perf_counter()
+        poller.refresh()
+        startup = time.perf_counter() - t0
+
+        cycles, deliveries, found = [], [], 0
+        before = mock_call(url, "/_mock/stats")
+        for _ in range(args.cycles):
+            if args.new_per_cycle:
+                mock_call(url, f"/_mock/publish?count={args.new_per_cycle}", method="POST")
+            scheduler.mark_all_due()
+            t0 = time.perf_counter()
+            found += poller.poll_due()
+            t1 = time.perf_counter()
+            for dispatcher in account.dispatchers:
+                dispatcher.drain(args.drain_timeout)
+            cycles.append(t1 - t0)
+            deliveries.append(time.perf_counter() - t1)
+        after = mock_call(url, "/_mock/stats")
+
+        api_requests = {
+            k: (after.get(k, 0) - before.get(k, 0)) / max(1, args.cycles)
+            for k in sorted(after) if k in ("announcements", "announcements_304", "verify_token", "purchased_batches", "api_503")
+        }
+        total_cycle = sum(cycles)
+        return {
+            "batches": args.batches,
+            "known_ids": seeded,
+            "cycles": args.cycles,
+            "new_per_cycle": args.new_per_cycle,
+            "startup_s": round(startup, 4),
+            "cycle_mean_s": round(statistics.mean(cycles), 4),
+            "cycle_p50_s": round(percentile(cycles, 50), 4),
+            "cycle_p95_s": round(percentile(cycles, 95), 4),
+            "cycle_max_s": round(max(cycles), 4),
+            "batches_per_s": round(args.batches * args.cycles / total_cycle, 1) if total_cycle else None,
+            "detected": found,
+            "deliver_mean_s": round(statistics.mean(deliveries), 4),
+            "delivered_per_s": round(found / sum(deliveries), 1) if sum(deliveries) else None,
+            "api_requests_per_cycle": api_requests,
+            "sink_requests": {k: v for k, v in after.items() if k.startswith(("discord", "telegram"))},
+            "client_http_requests": HTTP_REQUESTS.total(),
+            "pending_after": sum(d.pending() for d in account.dispatchers),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the poll-detect-deliver cycle against a local mock.")
+    add_arguments(parser)
+    parser.add_argument("--known-ids", type=int, default=100000, help="size of the seeded known-ID store")
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--new-per-cycle", type=int, default=20, help="announcements published before each cycle")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-pages", type=int, default=5)
+    parser.add_argument("--sink", choices=("discord", "telegram", "both"), default="discord")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    for key, value in result.items():
+        print(f"{key:>24}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# bench/bench_json.py
+"""
+Compares the old full-decode-then-copy parsing of API bodies with
+core.jsonstream's projection, for every installed backend (stdlib json,
+orjson, ijson), on realistic bodies from bench/mock_server.py. No network
+involved. Run from the repo root:
+
+    python -m bench.bench_json --page-size 100 --known-at 3
+
+--known-at N puts a known _id at position N of the announcement page, so the
+projection can stop there (the common steady-state poll: 0-3 new items).
+"""
+
+import json
+import time
+import argparse
+
+from bench.mock_server import MockState
+from core import jsonstream
+from core.announcer import BATCH_FIELDS, ANNOUNCEMENT_FIELDS, ANNOUNCEMENT_NESTED
+
+
+def bodies(args):
+    state = MockState(args.batches, args.page_size, args.page_size, 0, 0, 0, 0, False, 5)
+    items, _ = state.announcement_page(state.batch_ids[0], 1)
+    announcements = json.dumps({"success": True, "data": items}).encode()
+    batches = json.dumps({"success": True, "data": [state.batch(b) for b in state.batch_ids]}).encode()
+    return announcements, batches, items
+
+def old_announcements(content):
+    # What fetch_announcements did before: decode everything, copy a few fields
+    data = json.loads(content)
+    result = []
+    for ann in data["data"]:
+        info = {"announcement": ann.get("announcement"), "_id": ann.get("_id"), "scheduleTime": ann.get("scheduleTime")}
+        attachment = ann.get("attachment")
+        info["attachment"] = {
+            "name": attachment.get("name"), "baseUrl": attachment.get("baseUrl"), "key": attachment.get("key"),
+        } if attachment else None
+        result.append(info)
+    return result
+
+def old_batches(content):
+    data = json.loads(content)
+    return [{f: b.get(f) for f in BATCH_FIELDS} for b in data["data"]]
+
+def per_call_us(fn, content, repeat, number):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn(content)
+        best = min(best, (time.perf_counter() - t0) / number)
+    return round(best * 1e6, 1)
+
+def run(args):
+    ann_body, batch_body, items = bodies(args)
+    known = {items[args.known_at]["_id"]} if 0 <= args.known_at < len(items) else set()
+    stop = lambda item: item["_id"] in known
+    result = {
+        "announcement_page_bytes": len(ann_body),
+        "batch_list_bytes": len(batch_body),
+        "backends": list(jsonstream.AVAILABLE_BACKENDS),
+        "announcements_us": {"old": per_call_us(old_announcements, ann_body, args.repeat, args.number)},
+        "announcements_early_stop_us": {},
+        "batches_us": {"old": per_call_us(old_batches, batch_body, args.repeat, args.number)},
+    }
+    for backend in jsonstream.AVAILABLE_BACKENDS:
+        result["announcements_us"][backend] = per_call_us(
+            lambda c: jsonstream.project_data(c, ANNOUNCEMENT_FIELDS, ANNOUNCEMENT_NESTED, backend=backend),
+            ann_body, args.repeat, args.number)
+        result["announcements_early_stop_us"][backend] = per_call_us(
+            lambda c: jsonstream.project_data(c, ANNOUNCEMENT_FIELDS, ANNOUNCEMENT_NESTED, stop=stop, backend=backend),
+            ann_body, args.repeat, args.number)
+        result["batches_us"][backend] = per_call_us(
+            lambda c: jsonstream.project_data(c, BATCH_FIELDS, backend=backend),
+            batch_body, args.repeat, args.number)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API body parsing: full decode vs field projection.")
+    parser.add_argument("--page-size", type=int, default=20, help="announcements per page")
+    parser.add_argument("--batches", type=int, default=500, help="entries in the purchased-batches body")
+    parser.add_argument("--known-at", type=int, default=2, help="position of the first known _id (-1: none)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=200, help="calls per timing run")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"announcement page: {result['announcement_page_bytes']} bytes, "
+          f"batch list: {result['batch_list_bytes']} bytes, backends: {', '.join(result['backends'])}")
+    for key in ("announcements_us", "announcements_early_stop_us", "batches_us"):
+        print(f"{key:>28}: " + "   ".join(f"{k} {v}" for k, v in result[key].items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# bench/bench_records.py
+"""
+Compares the old plain-dict announcements with core.models.Announcement
+records on the in-memory part of the pipeline: projecting API items, tagging
+them per subscriber, sorting oldest first and formatting the notification
+time. No network involved. Run from the repo root:
+
+    python -m bench.bench_records --batches 50 --per-batch 200
+
+Reports retained memory (tracemalloc) and CPU time per stage for both shapes,
+plus the whole pipeline run on fresh records (total_ms).
+"""
+
+import gc
+import json
+import time
+import argparse
+import tracemalloc
+from datetime import datetime
+
+from bench.mock_server import MockState
+from core.models import Announcement
+
+
+def api_items(args):
+    state = MockState(args.batches, args.per_batch, args.per_batch, 0, 0, 0, 0, False, 5)
+    # Round-trip through JSON so strings aren't shared the way a generator would share them
+    items = [state.announcement(bid, i) for bid in state.batch_ids for i in range(args.per_batch, 0, -1)]
+    return json.loads(json.dumps(items))
+
+
+# --- the pre-record shape, as fetch_announcements / main.py / the notifiers used to handle it ---
+
+def dict_project(items):
+    result = []
+    for ann in items:
+        info = {
+            "announcement": ann.get("announcement"),
+            "_id": ann.get("_id"),
+            "scheduleTime": ann.get("scheduleTime"),
+        }
+        attachment = ann.get("attachment")
+        if attachment:
+            info["attachment"] = {
+                "name": attachment.get("name"),
+                "baseUrl": attachment.get("baseUrl"),
+                "key": attachment.get("key"),
+            }
+        else:
+            info["attachment"] = None
+        result.append(info)
+    return result
+
+def dict_tag(anns):
+    tagged = [dict(ann) for ann in anns]
+    for ann in tagged:
+        ann["batch_slug"] = "batch-" + ann["_id"][:6]
+        ann["batch_id"] = ann["_id"][:6]
+    return tagged
+
+def dict_sort(anns):
+    return sorted(anns, key=lambda x: x.get("scheduleTime", ""))
+
+def dict_format(anns):
+    for ann in anns:
+        try:
+            dt = datetime.fromisoformat(ann.get("scheduleTime", "")[:-1])
+            dt.strftime("%d %b %Y, %I:%M %p")
+        except Exception:
+            pass
+
+
+# --- the record shape ---
+
+def record_project(items):
+    return [Announcement.from_api(ann) for ann in items]
+
+def record_tag(anns):
+    return [ann.for_batch(ann.id[:6], "batch-" + ann.id[:6]) for ann in anns]
+
+def record_sort(anns):
+    return sorted(anns, key=Announcement.sort_key)
+
+def record_format(anns):
+    for ann in anns:
+        ann.notification_time()
+
+
+def retained_bytes(build, items):
+    """Bytes still allocated after build(items), i.e. what holding the result costs."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build(items)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+def best_time(fn, arg, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def run(args):
+    items = api_items(args)
+    shapes = {
+        "dict": (dict_project, dict_tag, dict_sort, dict_format),
+        "record": (record_project, record_tag, record_sort, record_format),
+    }
+    result = {"announcements": len(items)}
+    for name, (project, tag, sort, fmt) in shapes.items():
+        tagged = tag(project(items))
+        result[name] = {
+            "retained_kb": round(retained_bytes(lambda x: tag(project(x)), items) / 1024, 1),
+            "project_ms": round(best_time(project, items, args.repeat) * 1000, 2),
+            "tag_ms": round(best_time(tag, project(items), args.repeat) * 1000, 2),
+            "sort_ms": round(best_time(sort, tagged, args.repeat) * 1000, 2),
+            "format_ms": round(best_time(fmt, tagged, args.repeat) * 1000, 2),
+            # All four stages on fresh records, so work deferred to a later stage is counted once
+            "total_ms": round(best_time(lambda x: fmt(sort(tag(project(x)))), items, args.repeat) * 1000, 2),
+        }
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dict announcements against slotted records.")
+    parser.add_argument("--batches", type=int, default=50)
+    parser.add_argument("--per-batch", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per stage (best is reported)")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{result['announcements']} announcements")
+    for stage in ("retained_kb", "project_ms", "tag_ms", "sort_ms", "format_ms", "total_ms"):
+        d, r = result["dict"][stage], result["record"][stage]
+        print(f"{stage:>12}: dict {d:>10}   record {r:>10}   ({r / d:.2f}x)" if d else f"{stage:>12}: {d} / {r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# bench/mock_server.py
+"""
+Local stand-in for the penpencil API and the Discord/Telegram endpoints,
+used by the offline benchmarks. Run it directly:
+
+    python -m bench.mock_server --port 8900 --batches 500 --per-batch 200
+
+Endpoints:
+    POST /v3/oauth/verify-token
+    GET  /batch-service/v1/batches/purchased-batches?page=N
+    GET  /v1/batches/{id}/announcement?page=N   (ETag/If-None-Match with --etag)
+    GET  /static/...                             (attachment images and the logo)
+    POST /webhook/...                            (Discord webhook, multipart uploads with ?wait=true)
+    POST /bot{token}/sendPhoto                   (Telegram, URL / file_id / multipart upload)
+    POST /bot{token}/sendMessage                 (Telegram, text beyond a caption)
+    POST /_mock/publish?count=N                  (post N new announcements to random batches)
+    GET  /_mock/stats                            (request counters)
+"""
+
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+BASE_TIME = 1700000000  # announcement i of every batch is posted at BASE_TIME + i minutes
+
+# Smallest valid PNG, padded to a realistic image size
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+) + b"\0" * 50000
+_FILENAME = re.compile(rb'filename="([^"]+)"')
+
+
+def batch_id(i):
+    return f"b{i:05d}"
+
+def announcement_id(bid, i):
+    return f"{bid}a{i:07d}"
+
+
+class MockState:
+    def __init__(self, batches, per_batch, page_size, api_latency, sink_latency,
+                 rate_429, fail_rate, etag, discord_limit, api_fail_rate=0.0):
+        self.batch_ids = [batch_id(i) for i in range(batches)]
+        self.counts = {bid: per_batch for bid in self.batch_ids}
+        self.page_size = page_size
+        self.api_latency = api_latency
+        self.sink_latency = sink_latency
+        self.rate_429 = rate_429
+        self.fail_rate = fail_rate
+        self.etag = etag
+        self.discord_limit = discord_limit
+        self.api_fail_rate = api_fail_rate
+        # Where attachment images are served from; start_mock_server points it at the mock
+        self.base_url = "https://static.pw.live"
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def publish(self, n):
+        with self.lock:
+            for _ in range(n):
+                self.counts[random.choice(self.batch_ids)] += 1
+
+    def batch(self, bid):
+        return {
+            "_id": bid,
+            "name": f"Batch {bid}",
+            "slug": f"batch-{bid}",
+            "startDate": "2023-01-01T00:00:00.000Z",
+            "endDate": "2099-01-01T00:00:00.000Z",
+            "expiryDate": "2099-01-01T00:00:00.000Z",
+        }
+
+    def announcement(self, bid, i):
+        when = time.gmtime(BASE_TIME + i * 60)
+        return {
+            "_id": announcement_id(bid, i),
+            "announcement": f"Announcement {i} for {bid}. " + "Lorem ipsum dolor sit amet. " * 4,
+            "scheduleTime": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", when),
+            "attachment": None if i % 3 else {
+                # A handful of distinct images, reused the way real notices reuse banners
+                "name": "notice.png", "baseUrl": f"{self.base_url}/static/", "key": f"img{i % 10}.png",
+            },
+            # Fields the client ignores, to make responses realistically heavy
+            "createdBy": {"_id": "u1", "firstName": "PW", "lastName": "Team", "imageId": None},
+            "batchId": bid,
+            "status": "Active",
+            "tags": ["general"],
+        }
+
+    def announcement_page(self, bid, page):
+        with self.lock:
+            total = self.counts.get(bid)
+        if total is None:
+            return None, None
+        # Newest first
+        hi = total - (page - 1) * self.page_size
+        lo = max(0, hi - self.page_size)
+        items = [self.announcement(bid, i) for i in range(hi, lo, -1)] if hi > 0 else []
+        return items, f'"{bid}-{total}-{page}"'
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    state = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_bytes(self, data, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_GET(self):
+        st = self.state
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        page = int(query.get("page", ["1"])[0])
+        parts = url.path.strip("/").split("/")
+        if url.path == "/_mock/stats":
+            with st.lock:
+                return self._send(200, dict(st.stats))
+        if url.path.startswith("/static/"):
+            st.count("static")
+            return self._send_bytes(PNG_BYTES, "image/png")
+        time.sleep(st.api_latency)
+        if random.random() < st.api_fail_rate:
+            st.count("api_503")
+            return self._send(503, {"success": False, "message": "mock outage"})
+        if url.path.endswith("/purchased-batches"):
+            st.count("purchased_batches")
+            ids = st.batch_ids[(page - 1) * st.page_size: page * st.page_size]
+            return self._send(200, {"success": True, "data": [st.batch(b) for b in ids]})
+        if len(parts) == 4 and parts[:2] == ["v1", "batches"] and parts[3] == "announcement":
+            st.count("announcements")
+            items, etag = st.announcement_page(parts[2], page)
+            if items is None:
+                return self._send(404, {"success": False, "message": "Batch not found"})
+            if st.etag and self.headers.get("If-None-Match") == etag:
+                st.count("announcements_304")
+                return self._send(304)
+            headers = {"ETag": etag} if st.etag else None
+            return self._send(200, {"success": True, "data": items}, headers)
+        self._send(404, {"success": False, "message": "Not found"})
+
+    def do_POST(self):
+        st = self.state
+        url = urlparse(self.path)
+        body = self._read_body()
+        if url.path == "/_mock/publish":
+            st.publish(int(parse_qs(url.query).get("count", ["1"])[0]))
+            return self._send(200, {"ok": True})
+        if url.path == "/v3/oauth/verify-token":
+            time.sleep(st.api_latency)
+            st.count("verify_token")
+            return self._send(200, {"success": True, "data": {"isVerified": True}})
+        if url.path.startswith("/webhook"):
+            return self._sink("discord", body, parse_qs(url.query).get("wait") == ["true"])
+        if url.path.endswith("/sendPhoto"):
+            return self._sink("telegram", body)
+        if url.path.endswith("/sendMessage"):
+            st.count("telegram_message")
+            return self._sink("telegram", body)
+        self._send(404, {"success": False, "message": "Not found"})
+
+    def _sink(self, name, body=b"", wait=False):
+        st = self.state
+        uploads = [f.decode() for f in _FILENAME.findall(body)]
+        time.sleep(st.sink_latency)
+        st.count(name)
+        roll = random.random()
+        if roll < st.rate_429:
+            st.count(f"{name}_429")
+            if name == "telegram":
+                return self._send(429, {"ok": False, "error_code": 429, "parameters": {"retry_after": 1}})
+            return self._send(429, {"retry_after": 0.5, "global": False})
+        if roll < st.rate_429 + st.fail_rate:
+            st.count(f"{name}_500")
+            return self._send(500, {"message": "mock failure"})
+        if uploads:
+            st.count(f"{name}_upload")
+        if name == "telegram":
+            result = {"message_id": 1}
+            if uploads:
+                result["photo"] = [{"file_id": f"small-{uploads[0]}"}, {"file_id": f"file-{uploads[0]}"}]
+            elif b"photo=file-" in body:
+                st.count("telegram_by_file_id")
+            return self._send(200, {"ok": True, "result": result})
+        headers = {
+            "X-RateLimit-Limit": str(st.discord_limit),
+            "X-RateLimit-Remaining": str(st.discord_limit - 1),
+            "X-RateLimit-Reset-After": "1.0",
+        }
+        if not wait:
+            return self._send(204, headers=headers)
+        expires = format(int(time.time()) + 24 * 60 * 60, "x")
+        attachments = [{"filename": f, "url": f"{st.base_url}/cdn/{f}?ex={expires}"} for f in uploads]
+        return self._send(200, {"id": "1", "attachments": attachments}, headers)
+
+
+def start_mock_server(port=0, **options):
+    """Starts the mock in a background thread. Returns (server, base_url)."""
+    state = MockState(**options)
+    handler = type("Handler", (MockHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    state.base_url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state.base_url
+
+
+def add_arguments(parser):
+    parser.add_argument("--batches", type=int, default=500)
+    parser.add_argument("--per-batch", type=int, default=200, help="announcements already posted per batch")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--api-latency", type=float, default=0.02, help="seconds added to each API response")
+    parser.add_argument("--sink-latency", type=float, default=0.05, help="seconds added to each Discord/Telegram call")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of sink calls answered 429")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of sink calls answered 500")
+    parser.add_argument("--api-fail-rate", type=float, default=0.0, help="fraction of API GETs answered 503")
+    parser.add_argument("--etag", action="store_true", help="send ETags and honour If-None-Match")
+    parser.add_argument("--discord-limit", type=int, default=5, help="X-RateLimit-Limit per second")
+
+
+def options_from_args(args):
+    return {
+        "batches": args.batches,
+        "per_batch": args.per_batch,
+        "page_size": args.page_size,
+        "api_latency": args.api_latency,
+        "sink_latency": args.sink_latency,
+        "rate_429": args.rate_429,
+        "fail_rate": args.fail_rate,
+        "etag": args.etag,
+        "discord_limit": args.discord_limit,
+        "api_fail_rate": args.api_fail_rate,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock penpencil/Discord/Telegram server.")
+    parser.add_argument("--port", type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server, url = start_mock_server(args.port, **options_from_args(args))
+    print(url, flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
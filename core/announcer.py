@@ -1,91 +1,317 @@
 # core/annoucer.py
 
-import requests
-from core.utils import verify_token, get_auth_headers, BASE_URL
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from core.http import request
+from core.models import Announcement
+from core.jsonstream import project_data
+from core.metrics import CONDITIONAL_REQUESTS
+from core.utils import verify_token_cached, invalidate_token, get_auth_headers, BASE_URL
+
+AUTH_ERROR_STATUSES = (401, 403)
+
+# Default number of batches fetched in parallel
+DEFAULT_CONCURRENCY = 8
+
+# Pages walked on the first poll of a batch with no known IDs (so a fresh install is not flooded)
+DEFAULT_MAX_PAGES = 5
+
+# The only fields kept from API items; everything else is skipped while parsing
+BATCH_FIELDS = ("name", "_id", "slug", "startDate", "endDate", "expiryDate")
+ANNOUNCEMENT_FIELDS = ("_id", "announcement", "scheduleTime")
+ANNOUNCEMENT_NESTED = {"attachment": ("name", "baseUrl", "key")}
+
+# validator key (batch_id, or batch_id plus its subscribers, see fetch_new_announcements)
+# -> validators (etag, last_modified, digest) of the last fully processed first page
+_page_validators = {}
+# batch_id -> {"hits": int, "misses": int} for conditional first-page fetches
+_conditional_stats = {}
+_conditional_lock = threading.Lock()
+
+def _check_token(token):
+    """
+    Verifies the token, reusing a recent successful verification if there is one.
+    Returns None if the token is fine, else an error dict. The error has
+    token_rejected=True only when the verify endpoint answered that the token
+    is bad, not when it couldn't be reached or failed on its side.
+    """
+    verification = verify_token_cached(token)
+    if verification.get("success"):
+        return None
+    status = verification.get("error_status", None)
+    return {
+        "success": False,
+        "error_message": verification.get("error_message", "Token verification failed"),
+        "error_status": status,
+        "token_rejected": status is not None and status < 500,
+    }
+
+def _auth_error(token, resp, message):
+    """
+    Called when the API rejected a request with 401/403. Drops the cached
+    verification and re-verifies, so a revoked token is reported as such
+    (token_rejected=True). If the token still verifies, the 401/403 is about
+    this request only (e.g. a batch the account isn't enrolled in) and is
+    returned as a plain failure.
+    """
+    invalidate_token(token)
+    error = _check_token(token)
+    if error:
+        return error
+    return {"success": False, "error_message": message, "error_status": resp.status_code, "token_rejected": False}
 
 def fetch_batches(token, page=1):
     """
     Fetches all purchased batches for the authenticated user.
     Returns a list of dicts with: name, _id, slug, startDate, endDate, expiryDate.
     """
-    # Verify token before proceeding
-    verification = verify_token(token)
-    if not verification.get("success"):
-        return {
-            "success": False,
-            "error_message": verification.get("error_message", "Token verification failed"),
-            "error_status": verification.get("error_status", None)
-        }
+    # Verify token before proceeding (cached, see core.utils.TOKEN_VERIFY_TTL)
+    error = _check_token(token)
+    if error:
+        return error
     
     url = f"{BASE_URL}/batch-service/v1/batches/purchased-batches?amount=paid&page={page}&type=ALL"
     headers = get_auth_headers(token)
     try:
-        resp = requests.get(url, headers=headers, timeout=10)
-        data = resp.json()
-        if data.get("success") and isinstance(data.get("data"), list):
-            result = []
-            for batch in data["data"]:
-                result.append({
-                    "name": batch.get("name"),
-                    "_id": batch.get("_id"),
-                    "slug": batch.get("slug"),
-                    "startDate": batch.get("startDate"),
-                    "endDate": batch.get("endDate"),
-                    "expiryDate": batch.get("expiryDate"),
-                })
-            return {"success": True, "batches": result}
+        resp = request("GET", url, "purchased_batches", headers=headers, timeout=10)
+        meta, batches, _ = project_data(resp.content, BATCH_FIELDS)
+        if meta.get("success") and batches is not None:
+            return {"success": True, "batches": batches}
+        elif resp.status_code in AUTH_ERROR_STATUSES:
+            return _auth_error(token, resp, meta.get("message", "Failed to fetch batches"))
         else:
             return {
                 "success": False,
-                "error_message": data.get("message", "Failed to fetch batches"),
+                "error_message": meta.get("message", "Failed to fetch batches"),
                 "error_status": resp.status_code
             }
     except Exception as e:
         return {"success": False, "error_message": str(e), "error_status": None}
 
-def fetch_announcements(token, batch_id, page=1):
+def _record_conditional(batch_id, hit):
+    with _conditional_lock:
+        stats = _conditional_stats.setdefault(batch_id, {"hits": 0, "misses": 0})
+        stats["hits" if hit else "misses"] += 1
+    CONDITIONAL_REQUESTS.inc(batch=batch_id, result="hit" if hit else "miss")
+
+def get_conditional_stats():
+    """
+    Per-batch counts of first-page fetches that were skipped as unchanged (hits)
+    versus downloaded and parsed (misses).
+    """
+    with _conditional_lock:
+        return {bid: dict(stats) for bid, stats in _conditional_stats.items()}
+
+def get_page_validators():
+    """The remembered first-page validators, validator key -> validators (a copy, for checkpointing)."""
+    with _conditional_lock:
+        return dict(_page_validators)
+
+def restore_page_validators(validators):
+    """Reloads checkpointed first-page validators, so the first poll after a restart can still get a 304."""
+    with _conditional_lock:
+        for batch_id, value in validators.items():
+            _page_validators.setdefault(batch_id, value)
+
+def fetch_announcements(token, batch_id, page=1, validators=None, known_ids=None):
     """
     Fetches announcements for a specific batch.
-    Returns a list of dicts with: announcement, _id, scheduleTime, attachment (name, baseUrl, key).
-    """
-    # Verify token before proceeding
-    verification = verify_token(token)
-    if not verification.get("success"):
-        return {
-            "success": False,
-            "error_message": verification.get("error_message", "Token verification failed"),
-            "error_status": verification.get("error_status", None)
-        }
+    Returns a list of core.models.Announcement records.
+
+    If `known_ids` is given, parsing stops at the first announcement whose
+    _id is in it: only the ones before it are returned, and the result has
+    reached_known=True.
+
+    If `validators` from a previous result are passed, the request is made
+    conditional (If-None-Match / If-Modified-Since). When the server answers
+    304, or the body hashes the same as before, JSON decoding is skipped and
+    the result has not_modified=True and no announcements. Successful results
+    carry "validators" for the next call.
+    """
+    # Verify token before proceeding (cached, see core.utils.TOKEN_VERIFY_TTL)
+    error = _check_token(token)
+    if error:
+        return error
     
     url = f"{BASE_URL}/v1/batches/{batch_id}/announcement?page={page}"
     headers = get_auth_headers(token)
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
     try:
-        resp = requests.get(url, headers=headers, timeout=10)
-        data = resp.json()
-        if data.get("success") and isinstance(data.get("data"), list):
-            result = []
-            for ann in data["data"]:
-                announcement_info = {
-                    "announcement": ann.get("announcement"),
-                    "_id": ann.get("_id"),
-                    "scheduleTime": ann.get("scheduleTime"),
-                }
-                attachment = ann.get("attachment")
-                if attachment:
-                    announcement_info["attachment"] = {
-                        "name": attachment.get("name"),
-                        "baseUrl": attachment.get("baseUrl"),
-                        "key": attachment.get("key"),
-                    }
-                else:
-                    announcement_info["attachment"] = None
-                result.append(announcement_info)
-            return {"success": True, "announcements": result}
+        resp = request("GET", url, "announcements", headers=headers, timeout=10)
+        if validators and resp.status_code == 304:
+            return {"success": True, "not_modified": True, "announcements": [], "validators": validators}
+        new_validators = {
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "digest": hashlib.sha1(resp.content).hexdigest(),
+        }
+        # No usable headers (or the server ignores them): compare body hashes instead
+        if validators and resp.ok and new_validators["digest"] == validators.get("digest"):
+            return {"success": True, "not_modified": True, "announcements": [], "validators": new_validators}
+        stop = None
+        if known_ids is not None and resp.ok:
+            stop = lambda item: item["_id"] in known_ids
+        meta, items, reached_known = project_data(resp.content, ANNOUNCEMENT_FIELDS, ANNOUNCEMENT_NESTED, stop=stop)
+        # A stream cut short may not have reached "success" yet; a 2xx with a data list is enough then
+        if meta.get("success", reached_known) and items is not None:
+            result = [Announcement.from_api(ann) for ann in items]
+            return {"success": True, "announcements": result, "validators": new_validators,
+                    "reached_known": reached_known}
+        elif resp.status_code in AUTH_ERROR_STATUSES:
+            return _auth_error(token, resp, meta.get("message", "Failed to fetch announcements"))
         else:
             return {
                 "success": False,
-                "error_message": data.get("message", "Failed to fetch announcements"),
+                "error_message": meta.get("message", "Failed to fetch announcements"),
                 "error_status": resp.status_code
             }
     except Exception as e:
         return {"success": False, "error_message": str(e), "error_status": None}
+
+def iter_batch_pages(token, max_pages=None):
+    """
+    Lazily walks the purchased-batches pages, yielding one fetch_batches result per page.
+    Stops after an empty page, a failed page (which is yielded), or max_pages.
+    """
+    seen = set()
+    page = 1
+    while max_pages is None or page <= max_pages:
+        result = fetch_batches(token, page=page)
+        yield result
+        if not result.get("success"):
+            return
+        ids = {b["_id"] for b in result["batches"]}
+        # Empty page, or the API ignored `page` and repeated itself
+        if not ids or ids <= seen:
+            return
+        seen |= ids
+        page += 1
+
+def fetch_all_batches(token, max_pages=None):
+    """
+    Fetches every page of purchased batches.
+    Returns the same shape as fetch_batches, with all pages combined.
+    """
+    batches = []
+    seen = set()
+    for result in iter_batch_pages(token, max_pages):
+        if not result.get("success"):
+            return result
+        for batch in result["batches"]:
+            if batch["_id"] not in seen:
+                seen.add(batch["_id"])
+                batches.append(batch)
+    return {"success": True, "batches": batches}
+
+def iter_announcement_pages(token, batch_id, max_pages=None, first_page_validators=None, known_ids=None):
+    """
+    Lazily walks a batch's announcement pages (newest first), yielding one
+    fetch_announcements result per page. Stops after an empty page, a failed
+    page (which is yielded), an unchanged first page, a page that reached an
+    _id in known_ids, or max_pages.
+    """
+    seen = set()
+    page = 1
+    while max_pages is None or page <= max_pages:
+        validators = first_page_validators if page == 1 else None
+        result = fetch_announcements(token, batch_id, page=page, validators=validators, known_ids=known_ids)
+        yield result
+        if not result.get("success") or result.get("not_modified") or result.get("reached_known"):
+            return
+        ids = {ann.id for ann in result["announcements"]}
+        if not ids or ids <= seen:
+            return
+        seen |= ids
+        page += 1
+
+def _has_history(known_ids, batch_id):
+    """
+    True if known_ids already holds IDs for this batch (i.e. this isn't its
+    first poll). A plain set can't say, so it is treated as a first poll.
+    """
+    has_batch = getattr(known_ids, "has_batch", None)
+    return bool(has_batch and has_batch(batch_id))
+
+def fetch_new_announcements(token, batch_id, known_ids, max_pages=DEFAULT_MAX_PAGES, validator_key=None):
+    """
+    Walks announcement pages until it reaches an _id already in known_ids, so a
+    steady-state poll costs one page and a catch-up after downtime still sees
+    everything posted since. Returns the same shape as fetch_announcements,
+    with only the unseen announcements.
+
+    max_pages only caps the first poll of a batch with no known IDs (so a
+    fresh install doesn't replay its whole history); the result then has
+    truncated=True if it stopped there. A batch with known IDs is always
+    walked until it reaches one.
+
+    The first page's validators are remembered under validator_key (default
+    batch_id). A batch fetched once for several accounts must use a key per
+    subscriber set: an "unchanged" page only means something to the accounts
+    that saw it last time.
+    """
+    new = []
+    seen = set()
+    first_page = None
+    truncated = False
+    validator_key = validator_key or batch_id
+    with _conditional_lock:
+        validators = _page_validators.get(validator_key)
+    pages = iter_announcement_pages(token, batch_id, first_page_validators=validators, known_ids=known_ids)
+    for count, result in enumerate(pages, 1):
+        if not result.get("success"):
+            return result
+        if first_page is None:
+            first_page = result
+            if validators:
+                _record_conditional(batch_id, hit=bool(result.get("not_modified")))
+            if result.get("not_modified"):
+                return {"success": True, "not_modified": True, "announcements": []}
+        stop = False
+        for ann in result["announcements"]:
+            if ann.id in known_ids:
+                stop = True
+                break
+            if ann.id not in seen:
+                seen.add(ann.id)
+                new.append(ann)
+        if stop:
+            break
+        if count == max_pages and not _has_history(known_ids, batch_id):
+            truncated = True
+            break
+    # Only remember the first page once the whole walk succeeded, so a failed
+    # catch-up isn't mistaken for "nothing changed" on the next poll
+    if first_page is not None and first_page.get("validators"):
+        with _conditional_lock:
+            _page_validators[validator_key] = first_page["validators"]
+    return {"success": True, "announcements": new, "truncated": truncated}
+
+def fetch_new_announcements_many(jobs, max_workers=DEFAULT_CONCURRENCY, max_pages=DEFAULT_MAX_PAGES):
+    """
+    Runs fetch_new_announcements for several (token, batch_id, known_ids) or
+    (token, batch_id, known_ids, validator_key) jobs in parallel over the
+    shared session. Returns a list of results, in job order.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    workers = max(1, min(max_workers, len(jobs)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(
+            lambda job: fetch_new_announcements(job[0], job[1], job[2], max_pages, *job[3:]),
+            jobs,
+        ))
+
+def fetch_announcements_concurrently(token, batch_ids, known_ids, max_workers=DEFAULT_CONCURRENCY, max_pages=DEFAULT_MAX_PAGES):
+    """
+    Runs fetch_new_announcements for several batches of one account in parallel.
+    Returns a list of results, in the same order as batch_ids.
+    """
+    return fetch_new_announcements_many(
+        [(token, bid, known_ids) for bid in batch_ids], max_workers=max_workers, max_pages=max_pages
+    )
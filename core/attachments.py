@@ -0,0 +1,229 @@
+# core/attachments.py
+
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import mimetypes
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from core.http import request
+
+# Telegram's sendPhoto upload limit; bigger images are left to the platform to fetch
+MAX_FILE_BYTES = 10 * 1024 * 1024
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+CachedFile = namedtuple("CachedFile", "sha path filename content_type")
+
+
+def read_file(cached):
+    """Bytes of a CachedFile, or None if it was evicted meanwhile."""
+    try:
+        with open(cached.path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def discord_ref_expiry(url):
+    """Expiry (epoch) of a signed Discord CDN URL from its `ex` parameter, or None if unsigned."""
+    try:
+        return float(int(parse_qs(urlsplit(url).query)["ex"][0], 16))
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+class AttachmentCache:
+    """
+    Content-addressed image cache. Files live under `directory` named by
+    their SHA-256, so the same image behind several URLs is stored once;
+    an SQLite index maps URLs to files and keeps, per file and platform, the
+    reference the platform gave back after the first upload (a Telegram
+    file_id, a Discord CDN URL). Least recently used files are evicted once
+    the total passes max_bytes.
+
+    prefetch() downloads in the background as soon as announcements are
+    detected; resolve() is what the sinks call at send time.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            url TEXT PRIMARY KEY,
+            sha TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            content_type TEXT,
+            last_used REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_files_sha ON files (sha);
+        CREATE INDEX IF NOT EXISTS idx_files_last_used ON files (last_used);
+        CREATE TABLE IF NOT EXISTS refs (
+            sha TEXT NOT NULL,
+            platform TEXT NOT NULL,
+            ref TEXT NOT NULL,
+            expires_at REAL,
+            PRIMARY KEY (sha, platform)
+        );
+    """
+
+    # A platform reference this close to expiry is not used any more
+    REF_EXPIRY_MARGIN = 60 * 60
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, workers=4):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self.SCHEMA)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="attachment-fetch")
+        self._inflight = {}  # url -> Future
+        self._total = self._total_size()
+
+    def _total_size(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT SUM(size) FROM (SELECT MAX(size) AS size FROM files GROUP BY sha)"
+            ).fetchone()
+        return row[0] or 0
+
+    def _path(self, sha):
+        return os.path.join(self.directory, sha[:2], sha)
+
+    def _filename(self, sha, url, content_type):
+        ext = mimetypes.guess_extension(content_type or "") or os.path.splitext(urlsplit(url).path)[1] or ".jpg"
+        return sha[:16] + ext
+
+    def lookup(self, url):
+        """The cached file for a URL (marking it used), or None."""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT sha, content_type FROM files WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE files SET last_used = ? WHERE url = ?", (time.time(), url))
+        sha, content_type = row
+        path = self._path(sha)
+        if not os.path.isfile(path):
+            return None
+        return CachedFile(sha, path, self._filename(sha, url, content_type), content_type)
+
+    def fetch(self, url):
+        """Downloads a URL into the cache unless it's there already. Returns the CachedFile or None."""
+        cached = self.lookup(url)
+        if cached is not None:
+            return cached
+        try:
+            resp = request("GET", url, "attachment", timeout=20)
+        except Exception as e:
+            logging.warning(f"Could not fetch attachment {url}: {e}")
+            return None
+        content_type = (resp.headers.get("Content-Type") or "").split(";")[0].strip()
+        if not resp.ok or not content_type.startswith("image/") or len(resp.content) > MAX_FILE_BYTES:
+            # Left to the platform to fetch from the origin, as before
+            return None
+        data = resp.content
+        sha = hashlib.sha256(data).hexdigest()
+        path = self._path(sha)
+        if not os.path.isfile(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        with self._lock, self._conn:
+            known_sha = self._conn.execute("SELECT 1 FROM files WHERE sha = ? LIMIT 1", (sha,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (url, sha, size, content_type, last_used) VALUES (?, ?, ?, ?, ?)",
+                (url, sha, len(data), content_type, time.time()),
+            )
+            if known_sha is None:
+                self._total += len(data)
+        self._evict()
+        return CachedFile(sha, path, self._filename(sha, url, content_type), content_type)
+
+    def _fetch_once(self, url):
+        """Starts (or joins) a background fetch of url. Returns its Future."""
+        with self._lock:
+            future = self._inflight.get(url)
+            if future is None:
+                future = self._inflight[url] = self._pool.submit(self.fetch, url)
+                future.add_done_callback(lambda _, url=url: self._inflight.pop(url, None))
+        return future
+
+    def prefetch(self, urls):
+        """Downloads the given URLs in the background (already cached ones are skipped)."""
+        for url in set(u for u in urls if u):
+            self._fetch_once(url)
+
+    def get_ref(self, sha, platform):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT ref, expires_at FROM refs WHERE sha = ? AND platform = ?", (sha, platform)
+            ).fetchone()
+        if row is None or (row[1] is not None and row[1] - self.REF_EXPIRY_MARGIN < now):
+            return None
+        return row[0]
+
+    def set_ref(self, sha, platform, ref, expires_at=None):
+        """Remembers what `platform` calls this file after an upload, so it is only uploaded once."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO refs (sha, platform, ref, expires_at) VALUES (?, ?, ?, ?)",
+                (sha, platform, ref, expires_at),
+            )
+
+    def forget_ref(self, sha, platform):
+        """Drops a reference the platform no longer accepts; the next send uploads again."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM refs WHERE sha = ? AND platform = ?", (sha, platform))
+
+    def resolve(self, url, platform, wait=5.0):
+        """
+        What to send for `url` to `platform`, as (ref, CachedFile): a ref
+        means it was uploaded before and the ref can be sent instead; with
+        only the CachedFile it should be uploaded; (None, None) means fall
+        back to the URL. Waits up to `wait` seconds for a fetch that hasn't
+        finished yet.
+        """
+        cached = self.lookup(url)
+        if cached is None:
+            future = self._fetch_once(url)
+            try:
+                cached = future.result(timeout=wait)
+            except Exception:
+                return None, None
+            if cached is None:
+                return None, None
+        return self.get_ref(cached.sha, platform), cached
+
+    def _evict(self):
+        """Deletes least recently used files until the cache fits in max_bytes."""
+        if self._total <= self.max_bytes:
+            return
+        removed = 0
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT url, sha, size FROM files ORDER BY last_used").fetchall()
+            for url, sha, size in rows:
+                if self._total <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM files WHERE url = ?", (url,))
+                if self._conn.execute("SELECT 1 FROM files WHERE sha = ? LIMIT 1", (sha,)).fetchone():
+                    continue  # another URL still points at the same file
+                self._conn.execute("DELETE FROM refs WHERE sha = ?", (sha,))
+                try:
+                    os.remove(self._path(sha))
+                except OSError:
+                    pass
+                self._total -= size
+                removed += 1
+        if removed:
+            logging.info(f"Evicted {removed} cached attachment(s) to stay under {self.max_bytes // (1024 * 1024)} MB.")
+
+    def close(self):
+        # Queued prefetches are dropped; one already downloading finishes before the index closes
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            self._conn.close()
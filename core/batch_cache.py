@@ -0,0 +1,74 @@
+# core/batch_cache.py
+
+import os
+import json
+import time
+import hashlib
+from core.announcer import fetch_all_batches
+from core.utils import write_json_atomic
+
+def _token_fingerprint(token):
+    # Never write the token itself to disk
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+
+class BatchCache:
+    """
+    Keeps the purchased-batches list on disk and only re-fetches it every
+    refresh_interval seconds, or sooner after invalidate(). The cache is
+    tied to the token it was fetched with, so switching accounts refetches.
+    """
+
+    def __init__(self, filepath, refresh_interval):
+        self.filepath = filepath
+        self.refresh_interval = refresh_interval
+        self._fetched_at = 0
+        self._fingerprint = None
+        self._batches = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.filepath, "r") as f:
+                data = json.load(f)
+            self._fetched_at = float(data["fetched_at"])
+            self._fingerprint = data["token"]
+            self._batches = list(data["batches"])
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            self._fetched_at, self._fingerprint, self._batches = 0, None, None
+
+    def _save(self):
+        write_json_atomic(self.filepath, {
+            "fetched_at": self._fetched_at,
+            "token": self._fingerprint,
+            "batches": self._batches,
+        })
+
+    def is_fresh(self, token, now=None):
+        now = time.time() if now is None else now
+        return (
+            self._batches is not None
+            and self._fingerprint == _token_fingerprint(token)
+            and now - self._fetched_at < self.refresh_interval
+        )
+
+    def get(self, token, force=False):
+        """
+        Returns the same shape as fetch_all_batches. Served from the cache
+        (with from_cache=True) while it is fresh, otherwise fetched and saved.
+        """
+        if not force and self.is_fresh(token):
+            return {"success": True, "batches": list(self._batches), "from_cache": True}
+        result = fetch_all_batches(token)
+        if result.get("success"):
+            self._batches = list(result["batches"])
+            self._fetched_at = time.time()
+            self._fingerprint = _token_fingerprint(token)
+            self._save()
+        return result
+
+    def invalidate(self):
+        """Forces the next get() to hit the network, e.g. after a batch returned 404."""
+        self._fetched_at = 0
+        if os.path.isfile(self.filepath):
+            self._save()
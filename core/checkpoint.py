@@ -0,0 +1,102 @@
+# core/checkpoint.py
+
+import json
+import time
+import sqlite3
+import threading
+
+
+class StateCheckpoint:
+    """
+    Process-wide state that makes a restart cheap: each batch's next-due
+    time and polling interval, and the first-page validators (ETags) that
+    let an unchanged page come back as a 304. Saved incrementally, only what
+    changed, after every poll cycle; the known-ID store and the outbox
+    already persist detection and delivery as they happen.
+
+    SQLite in WAL mode, so a crash loses at most the last cycle's
+    changes, and then those batches are simply polled again.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS schedule (
+            batch_id TEXT PRIMARY KEY,
+            due REAL NOT NULL,
+            interval REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS validators (
+            batch_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filepath, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL with synchronous=NORMAL can only lose the last commits on power loss, never corrupt
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._validators = {}  # last saved, to write only what changed
+
+    def load_schedule(self):
+        """{batch_id: (due, interval)} as last checkpointed."""
+        with self._lock:
+            rows = self._conn.execute("SELECT batch_id, due, interval FROM schedule").fetchall()
+        return {batch_id: (due, interval) for batch_id, due, interval in rows}
+
+    def saved_at(self):
+        """Epoch of the last save, or None for a new checkpoint."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'saved_at'").fetchone()
+        return float(row[0]) if row else None
+
+    def load_validators(self):
+        """{validator key: validators} as last checkpointed (the batch_id column holds the key)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT batch_id, data FROM validators").fetchall()
+        result = {}
+        for batch_id, data in rows:
+            try:
+                result[batch_id] = json.loads(data)
+            except ValueError:
+                continue
+        self._validators = dict(result)
+        return result
+
+    def save(self, scheduler, validators=None):
+        """
+        Writes the scheduler's changes since the last save and any validators
+        that differ from the saved ones, in one transaction. Returns the
+        number of rows written.
+        """
+        changed, removed = scheduler.take_changes()
+        updated = {
+            batch_id: value for batch_id, value in (validators or {}).items()
+            if self._validators.get(batch_id) != value
+        }
+        if not changed and not removed and not updated:
+            return 0
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO schedule (batch_id, due, interval) VALUES (?, ?, ?)", changed
+            )
+            self._conn.executemany("DELETE FROM schedule WHERE batch_id = ?", ((b,) for b in removed))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO validators (batch_id, data) VALUES (?, ?)",
+                ((batch_id, json.dumps(value)) for batch_id, value in updated.items()),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('saved_at', ?)", (str(time.time()),)
+            )
+        self._validators.update(updated)
+        return len(changed) + len(removed) + len(updated)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,66 @@
+# core/config_watch.py
+
+import os
+import threading
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class ConfigWatcher:
+    """
+    Watches config files for changes by polling their mtime/size from a
+    background thread (a stat per file per interval, no parsing). When one
+    changes it is remembered for pop_changed() and `wake` is set, so a
+    sleeping main loop applies the change straight away.
+    """
+
+    def __init__(self, paths, wake, interval=1.0):
+        self.paths = [os.path.abspath(p) for p in paths]
+        self.wake = wake
+        self.interval = interval
+        self._signatures = {p: _signature(p) for p in self.paths}
+        self._changed = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="config-watch", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def check(self):
+        """Stats every watched file once. Returns True if any changed."""
+        found = False
+        for path in self.paths:
+            sig = _signature(path)
+            if sig != self._signatures[path]:
+                self._signatures[path] = sig
+                # A half-written or deleted file is picked up on its next change
+                if sig is not None:
+                    with self._lock:
+                        self._changed.add(path)
+                    found = True
+        if found:
+            self.wake.set()
+        return found
+
+    def pop_changed(self):
+        """Returns (and forgets) the set of absolute paths that changed since the last call."""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+        return changed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
@@ -0,0 +1,187 @@
+# core/control.py
+
+import json
+import math
+import time
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from core.metrics import REGISTRY
+from core.http import breaker_states
+from core.announcer import get_conditional_stats
+
+
+class Controller:
+    """
+    Runtime controls for the main loop. Every command sets `wake`, so the
+    loop reacts within milliseconds instead of finishing its sleep.
+    """
+
+    def __init__(self, poller, scheduler, wake=None):
+        self.poller = poller
+        self.scheduler = scheduler
+        self.wake = wake or threading.Event()
+        self.paused = False
+        self.stopping = False
+        self._poll_requested = False
+        self._lock = threading.Lock()
+
+    def wait(self, timeout):
+        """Sleeps up to `timeout` seconds, returning early on any command or config change."""
+        self.wake.wait(timeout)
+        self.wake.clear()
+
+    def request_poll(self):
+        """Makes every tracked batch due on the next loop turn."""
+        with self._lock:
+            self._poll_requested = True
+        self.wake.set()
+
+    def take_poll_request(self):
+        with self._lock:
+            requested, self._poll_requested = self._poll_requested, False
+        return requested
+
+    def pause(self):
+        self.paused = True
+        self.wake.set()
+
+    def resume(self):
+        self.paused = False
+        self.wake.set()
+
+    def pending(self):
+        return sum(d.pending() for a in self.poller.accounts for d in a.dispatchers)
+
+    def drain(self, timeout=None):
+        """
+        Waits for every dispatcher to send what is pending, `timeout` seconds
+        at most in total. Returns True if all drained.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ok = True
+        for account in self.poller.accounts:
+            for dispatcher in account.dispatchers:
+                left = None if deadline is None else max(0.0, deadline - time.monotonic())
+                ok = dispatcher.drain(left) and ok
+        return ok
+
+    def stop(self, timeout=None):
+        """
+        Drains pending sends for up to `timeout` seconds, then stops every
+        account's workers and closes its attachment cache. Returns True if
+        everything was sent.
+        """
+        drained = True
+        if self.pending():
+            logging.info(f"Draining {self.pending()} pending send(s) before exit...")
+            drained = self.drain(timeout)
+        for account in self.poller.accounts:
+            account.close()
+        return drained
+
+    def shutdown(self):
+        """Asks the main loop to stop after its current step."""
+        self.stopping = True
+        self.wake.set()
+
+    def status(self):
+        return {
+            "paused": self.paused,
+            "stopping": self.stopping,
+            "accounts": [
+                {
+                    "name": a.name,
+                    "paused": a.paused,
+                    "disabled": a.disabled,
+                    "awaiting_token": a.awaiting_token,
+                    "token_expires_in": a.token_manager.seconds_left() if a.token_manager else None,
+                    "batches": len(a.batches),
+                    "pending": sum(d.pending() for d in a.dispatchers),
+                }
+                for a in self.poller.accounts
+            ],
+            "scheduled_batches": len(self.scheduler),
+            "next_poll_in": self.scheduler.seconds_until_next(),
+            "circuits": breaker_states(),
+            # batch_id -> {"hits", "misses"} of conditional first-page fetches
+            "conditional": get_conditional_stats(),
+        }
+
+
+class _ControlHandler(BaseHTTPRequestHandler):
+    controller = None
+
+    def log_message(self, format, *args):
+        logging.debug("control: " + format % args)
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/status":
+            return self._reply(200, self.controller.status())
+        if path == "/metrics":
+            data = REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        timeout = None
+        if "timeout" in query:
+            try:
+                timeout = float(query["timeout"][0])
+            except ValueError:
+                timeout = -1.0
+            if not math.isfinite(timeout) or timeout < 0:
+                return self._reply(400, {"error": "timeout must be a number of seconds"})
+        ctl = self.controller
+        if url.path == "/poll":
+            ctl.request_poll()
+            return self._reply(200, {"ok": True})
+        if url.path == "/pause":
+            ctl.pause()
+            return self._reply(200, {"ok": True, "paused": True})
+        if url.path == "/resume":
+            ctl.resume()
+            return self._reply(200, {"ok": True, "paused": False})
+        if url.path == "/drain":
+            drained = ctl.drain(timeout)
+            return self._reply(200, {"ok": drained, "pending": ctl.pending()})
+        if url.path == "/shutdown":
+            # Stop polling first; the main loop then drains for shutdown_drain_seconds on its way out.
+            # With ?timeout= the reply also waits (that long at most) for queued sends to finish.
+            ctl.shutdown()
+            if timeout is None:
+                return self._reply(202, {"ok": True, "pending": ctl.pending()})
+            drained = ctl.drain(timeout)
+            return self._reply(200, {"ok": drained, "pending": ctl.pending()})
+        self._reply(404, {"error": "not found"})
+
+
+def start_control_server(controller, port, host="127.0.0.1"):
+    """
+    Serves the controller on http://host:port from a background thread:
+    GET /status, GET /metrics, POST /poll, /pause, /resume, /drain[?timeout=s], /shutdown[?timeout=s].
+    Returns the server (call .shutdown() to stop it).
+    """
+    handler = type("ControlHandler", (_ControlHandler,), {"controller": controller})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="control-server", daemon=True).start()
+    logging.info(f"Control endpoint listening on http://{host}:{server.server_port}")
+    return server
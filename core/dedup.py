@@ -0,0 +1,90 @@
+# core/dedup.py
+
+import re
+import time
+import hashlib
+from collections import OrderedDict
+from core.models import Announcement
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def content_key(announcement):
+    """
+    Hash of the normalized announcement text plus attachment key. The same
+    notice posted to several batches gets different _ids but the same key.
+    """
+    text = _WHITESPACE.sub(" ", announcement.text or "").strip().lower()
+    attachment_key = announcement.attachment.key if announcement.attachment else None
+    raw = f"{text}\x00{attachment_key or ''}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class RollingDeduper:
+    """
+    Collapses announcements with the same content_key within a time window,
+    as long as they come from different batches; the same text posted again
+    in a batch it was already seen in is a genuine repost and is kept.
+    Duplicates found in one pass are merged into the oldest copy, which gets
+    a `batch_slugs` list of every batch it was posted to. A duplicate
+    arriving in a later pass, while the first copy is still inside the
+    window, is returned as merged into that copy's _id, so the caller can
+    add its batch to the notification already queued. Memory is bounded by
+    max_entries (oldest evicted first).
+    """
+
+    def __init__(self, window_seconds=24 * 60 * 60, max_entries=5000):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        # content key -> (first-seen time, _id notified, batch_ids it covers), oldest first
+        self._seen = OrderedDict()
+
+    def _expire(self, now):
+        cutoff = now - self.window_seconds
+        while self._seen:
+            key, (seen_at, _, _) = next(iter(self._seen.items()))
+            if seen_at >= cutoff and len(self._seen) <= self.max_entries:
+                break
+            self._seen.popitem(last=False)
+
+    def collapse(self, announcements, now=None):
+        """
+        Returns (announcements to notify, oldest first, with same-pass
+        duplicates merged into them; number of duplicates removed; list of
+        (duplicate, _id of the earlier notification it belongs to) for
+        duplicates of an earlier pass). Every removed duplicate is counted,
+        merged ones included.
+        """
+        if self.window_seconds <= 0:
+            return list(announcements), 0, []
+        now = time.time() if now is None else now
+        self._expire(now)
+        kept = []
+        merged = []
+        by_key = {}  # content key -> (copy kept this pass, batch_ids it covers)
+        dropped = 0
+        for ann in sorted(announcements, key=Announcement.sort_key):
+            key = content_key(ann)
+            slug = ann.batch_slug
+            if key in by_key and ann.batch_id not in by_key[key][1]:
+                first, batches = by_key[key]
+                batches.add(ann.batch_id)
+                if slug and slug not in first.batch_slugs:
+                    first.batch_slugs.append(slug)
+                dropped += 1
+                continue
+            ann.batch_slugs = [slug] if slug else []
+            if key not in by_key and key in self._seen:
+                seen_at, first_id, batches = self._seen[key]
+                if ann.batch_id not in batches:
+                    batches.add(ann.batch_id)
+                    merged.append((ann, first_id))
+                    dropped += 1
+                    continue
+            by_key[key] = (ann, {ann.batch_id})
+            kept.append(ann)
+        for key, (ann, batches) in by_key.items():
+            self._seen.pop(key, None)
+            self._seen[key] = (now, ann.id, batches)
+        self._expire(now)
+        return kept, dropped, merged
@@ -0,0 +1,328 @@
+# core/exporter.py
+
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from core.announcer import fetch_announcements, DEFAULT_CONCURRENCY
+from core.models import Announcement
+from core.utils import write_json_atomic
+
+EXPORT_FORMATS = ("jsonl", "sqlite")
+
+# Records handed to a known-ID store at a time when seeding from an existing output
+SEED_CHUNK = 500
+
+
+def export_record(announcement):
+    """The normalized form written out: Announcement.to_dict() without the dedup-only batch_slugs."""
+    record = announcement.to_dict()
+    del record["batch_slugs"]
+    return record
+
+def guess_format(path):
+    return "sqlite" if os.path.splitext(path)[1].lower() in (".db", ".sqlite", ".sqlite3") else "jsonl"
+
+
+# --- Writers ---
+# Both take whole pages through write_page(), which also records how far
+# the batch got, and report that back through progress() for a resume.
+
+class JsonlWriter:
+    """
+    Appends one JSON record per line. Progress lives in a sidecar
+    <path>.progress.json, written atomically after the page's lines are
+    flushed, with the number of lines written per batch. After a crash,
+    any lines of a batch past that count come from a page written but not
+    yet recorded; that page is fetched again, so those keys are skipped
+    when it comes back. Within a run, each page is checked against the
+    batch's previous page (items shift down a page as new ones are posted).
+    Memory is bounded by about a page per batch. A torn last line is cut off.
+    """
+
+    def __init__(self, path, fresh=False):
+        self.path = path
+        self.progress_path = path + ".progress.json"
+        self._lock = threading.Lock()
+        self._progress = {}
+        # batch_id -> keys of lines written past the recorded count before a crash
+        self._unrecorded = {}
+        # batch_id -> keys of the batch's last page written in this run
+        self._last_page = {}
+        if fresh:
+            for p in (path, self.progress_path):
+                if os.path.exists(p):
+                    os.remove(p)
+        elif os.path.exists(path):
+            self._progress = self._load_progress()
+            self._scan()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _load_progress(self):
+        try:
+            with open(self.progress_path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _scan(self):
+        """Collects the keys written past each batch's recorded count, and cuts off a torn last line."""
+        seen, good, bad = {}, 0, 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn write; only ever the last line
+                good += len(line)
+                try:
+                    record = json.loads(line)
+                    batch_id, key = record["batch_id"], (record["batch_id"], record["_id"])
+                except (ValueError, KeyError, TypeError):
+                    bad += 1
+                    continue
+                n = seen[batch_id] = seen.get(batch_id, 0) + 1
+                entry = self._progress.get(batch_id)
+                if n > (entry["count"] if entry else 0):
+                    self._unrecorded.setdefault(batch_id, set()).add(key)
+        if bad:
+            logging.warning(f"{self.path}: skipped {bad} unreadable line(s).")
+        if good != os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+        # Lines of an unrecorded page stay in the file, so count them
+        for batch_id, n in seen.items():
+            entry = self._progress.setdefault(batch_id, {"next_page": 1, "done": False, "count": 0})
+            entry["count"] = n
+            if entry["done"]:
+                self._unrecorded.pop(batch_id, None)
+
+    def iter_records(self, batch_ids):
+        """Records already in the file for the given batches, as Announcements."""
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and record.get("batch_id") in batch_ids:
+                    yield Announcement.from_dict(record)
+
+    def progress(self):
+        """{batch_id: {"next_page": int, "done": bool, "count": int}}"""
+        with self._lock:
+            return {k: dict(v) for k, v in self._progress.items()}
+
+    def write_page(self, batch_id, announcements, next_page, done):
+        """Writes a page's records (skipping ones already in the file) and records the batch's position."""
+        with self._lock:
+            lines = []
+            skip = self._unrecorded.get(batch_id, set()) | self._last_page.get(batch_id, set())
+            page_keys = set()
+            for ann in announcements:
+                key = (ann.batch_id, ann.id)
+                if key not in skip and key not in page_keys:
+                    page_keys.add(key)
+                    lines.append(json.dumps(export_record(ann), ensure_ascii=False) + "\n")
+            if lines:
+                self._file.writelines(lines)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            entry = self._progress.setdefault(batch_id, {"next_page": 1, "done": False, "count": 0})
+            entry.update(next_page=next_page, done=done, count=entry["count"] + len(lines))
+            write_json_atomic(self.progress_path, self._progress)
+            if done:
+                self._unrecorded.pop(batch_id, None)
+                self._last_page.pop(batch_id, None)
+            else:
+                self._last_page[batch_id] = {(ann.batch_id, ann.id) for ann in announcements}
+            return len(lines)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class SqliteWriter:
+    """
+    Writes records into an `announcements` table keyed by (batch_id, id).
+    Each page's rows and the batch's position are committed together, so a
+    resume starts exactly after the last page written.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS announcements (
+            batch_id TEXT NOT NULL,
+            id TEXT NOT NULL,
+            batch_slug TEXT,
+            text TEXT,
+            schedule_time TEXT,
+            posted_at INTEGER,
+            attachment_url TEXT,
+            record TEXT NOT NULL,
+            PRIMARY KEY (batch_id, id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_announcements_posted
+            ON announcements (batch_id, posted_at);
+        CREATE TABLE IF NOT EXISTS export_progress (
+            batch_id TEXT PRIMARY KEY,
+            next_page INTEGER NOT NULL,
+            done INTEGER NOT NULL,
+            count INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, path, fresh=False):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self.SCHEMA)
+        if fresh:
+            with self._conn:
+                self._conn.execute("DELETE FROM announcements")
+                self._conn.execute("DELETE FROM export_progress")
+
+    def iter_records(self, batch_ids):
+        """Records already in the table for the given batches, as Announcements."""
+        for batch_id in batch_ids:
+            with self._lock:
+                rows = self._conn.execute("SELECT record FROM announcements WHERE batch_id = ?", (batch_id,)).fetchall()
+            for (record,) in rows:
+                yield Announcement.from_dict(json.loads(record))
+
+    def progress(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT batch_id, next_page, done, count FROM export_progress").fetchall()
+        return {b: {"next_page": page, "done": bool(done), "count": count} for b, page, done, count in rows}
+
+    def write_page(self, batch_id, announcements, next_page, done):
+        rows = [
+            (ann.batch_id, ann.id, ann.batch_slug, ann.text, ann.schedule_time, ann.posted_at,
+             ann.attachment.url if ann.attachment else None, json.dumps(export_record(ann), ensure_ascii=False))
+            for ann in announcements
+        ]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO announcements "
+                "(batch_id, id, batch_slug, text, schedule_time, posted_at, attachment_url, record) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            added = self._conn.total_changes - before
+            self._conn.execute(
+                "INSERT INTO export_progress (batch_id, next_page, done, count) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (batch_id) DO UPDATE SET next_page = excluded.next_page, "
+                "done = excluded.done, count = count + excluded.count",
+                (batch_id, next_page, int(done), added),
+            )
+        return added
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_writer(path, fmt=None, fresh=False):
+    """A JsonlWriter or SqliteWriter for `path` (format from the extension unless given)."""
+    fmt = fmt or guess_format(path)
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unknown export format {fmt!r} (use {', '.join(EXPORT_FORMATS)})")
+    return SqliteWriter(path, fresh) if fmt == "sqlite" else JsonlWriter(path, fresh)
+
+
+# --- Export ---
+
+def export_batch(token, batch, writer, start_page=1, seed_stores=(), max_pages=None):
+    """
+    Walks one batch's announcement pages from start_page to the end,
+    writing each page as it arrives; only one page is held in memory.
+    Returns {"success": bool, "done": bool, "written": int, "pages": int}
+    plus error_message / error_status on failure. done is False after a
+    failure or max_pages; the position is kept either way, so the next run
+    resumes from there.
+    """
+    batch_id = batch["_id"]
+    slug = batch.get("slug") or batch.get("name") or batch_id
+    page, pages, written, prev_ids, done = start_page, 0, 0, None, False
+    while max_pages is None or pages < max_pages:
+        result = fetch_announcements(token, batch_id, page=page)
+        if not result.get("success"):
+            return {"success": False, "done": False, "written": written, "pages": pages,
+                    "error_message": result.get("error_message"), "error_status": result.get("error_status")}
+        anns = [ann.for_batch(batch_id, slug) for ann in result["announcements"]]
+        ids = {ann.id for ann in anns}
+        # Empty page, or the API ignored `page` and repeated itself
+        if not ids or ids == prev_ids:
+            writer.write_page(batch_id, [], page, True)
+            done = True
+            break
+        written += writer.write_page(batch_id, anns, page + 1, False)
+        for store in seed_stores:
+            store.add_announcements(anns)
+        prev_ids = ids
+        page += 1
+        pages += 1
+    return {"success": True, "done": done, "written": written, "pages": pages}
+
+def seed_existing(writer, batch_ids, seed_stores):
+    """Marks the records already in the output for batch_ids as known. Returns how many were read."""
+    if not batch_ids:
+        return 0
+    total, chunk = 0, []
+    for ann in writer.iter_records(set(batch_ids)):
+        chunk.append(ann)
+        if len(chunk) >= SEED_CHUNK:
+            for store in seed_stores:
+                store.add_announcements(chunk)
+            total += len(chunk)
+            chunk = []
+    if chunk:
+        for store in seed_stores:
+            store.add_announcements(chunk)
+        total += len(chunk)
+    logging.info(f"Seeded {total} record(s) already in the output as known.")
+    return total
+
+def export_announcements(token, batches, writer, seed_stores=(), concurrency=DEFAULT_CONCURRENCY, max_pages=None):
+    """
+    Exports the full history of `batches`, several batches at a time.
+    Batches finished by an earlier run are skipped, and unfinished ones
+    resume at the page after the last one written. With seed_stores
+    (known-ID stores), everything exported is also marked as known, so a
+    new deployment starts without notifying the backlog; records an
+    earlier run already wrote for these batches are seeded from the output
+    first, whether or not that run seeded them.
+    Returns {batch_id: export_batch result}.
+    """
+    progress = writer.progress()
+    if seed_stores:
+        seed_existing(writer, [b["_id"] for b in batches if b["_id"] in progress], seed_stores)
+    todo = []
+    for batch in batches:
+        entry = progress.get(batch["_id"])
+        if entry and entry["done"]:
+            logging.info(f"{batch.get('slug') or batch['_id']}: already exported ({entry['count']} record(s)).")
+            continue
+        todo.append((batch, entry["next_page"] if entry else 1))
+    if not todo:
+        return {}
+
+    def run(job):
+        batch, start_page = job
+        label = batch.get("slug") or batch["_id"]
+        if start_page > 1:
+            logging.info(f"{label}: resuming at page {start_page}.")
+        started = time.perf_counter()
+        result = export_batch(token, batch, writer, start_page, seed_stores, max_pages)
+        if result["success"]:
+            logging.info(f"{label}: {result['written']} record(s) from {result['pages']} page(s) in {time.perf_counter() - started:.1f}s"
+                         f"{'' if result['done'] else ', more left'}.")
+        else:
+            logging.error(f"{label}: stopped after {result['pages']} page(s): {result['error_message']}. Run again to resume.")
+        return batch["_id"], result
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(todo)))) as pool:
+        return dict(pool.map(run, todo))
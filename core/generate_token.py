@@ -1,10 +1,11 @@
 # core/generate_token.py
 
-import requests
+import os
 import uuid
+from core.http import request
 
 # --- Constants (reused across functions) ---
-BASE_URL = "https://api.penpencil.co"
+BASE_URL = os.environ.get("PW_API_BASE_URL", "https://api.penpencil.co")
 ORGANIZATION_ID = "5eb393ee95fab7468a79d189"
 REFERER = "https://www.pw.live/"
 CONTENT_TYPE = "application/json"
@@ -41,7 +42,7 @@ def send_otp(phone: str, country_code: str, random_id=None):
         "organizationId": ORGANIZATION_ID
     }
     try:
-        resp = requests.post(url, json=payload, headers=headers, timeout=10)
+        resp = request("POST", url, "get_otp", json=payload, headers=headers, timeout=10)
         data = resp.json()
         if data.get("success"):
             return {"success": True}
@@ -74,7 +75,7 @@ def get_token(phone: str, otp: str, random_id=None):
         "organizationId": ORGANIZATION_ID
     }
     try:
-        resp = requests.post(url, json=payload, headers=headers, timeout=10)
+        resp = request("POST", url, "oauth_token", json=payload, headers=headers, timeout=10)
         data = resp.json()
         if data.get("success") and "data" in data:
             return {
@@ -0,0 +1,264 @@
+# core/http.py
+
+import time
+import random
+import logging
+import threading
+import requests
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from core.metrics import (
+    HTTP_REQUESTS, HTTP_ERRORS, HTTP_LATENCY, HTTP_RETRIES, CIRCUIT_STATE, CIRCUIT_REJECTED,
+)
+
+# Number of keep-alive connections kept open per host
+DEFAULT_POOL_SIZE = 10
+
+# Retries of one request (idempotent methods only, unless the caller says otherwise)
+DEFAULT_MAX_RETRIES = 2
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+# Longest Retry-After we sleep through inside a request; longer ones go back to the caller
+MAX_RETRY_AFTER = 30.0
+RETRY_STATUSES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Consecutive failures (timeouts, connection errors, 5xx) that open a host's circuit
+DEFAULT_FAILURE_THRESHOLD = 5
+# How long an open circuit refuses calls before letting one trial through; doubles on each failed trial
+DEFAULT_RESET_TIMEOUT = 30.0
+MAX_RESET_TIMEOUT = 10 * 60.0
+
+_session = None
+_session_lock = threading.Lock()
+
+_max_retries = DEFAULT_MAX_RETRIES
+_failure_threshold = DEFAULT_FAILURE_THRESHOLD
+_reset_timeout = DEFAULT_RESET_TIMEOUT
+_breakers = {}  # host -> CircuitBreaker
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling a host whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Per-host breaker. After failure_threshold consecutive failures it opens
+    and refuses calls for reset_timeout seconds; then one trial call goes
+    through (half-open). Success closes it, failure re-opens it for twice as
+    long, up to MAX_RESET_TIMEOUT.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, host, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._open_for = reset_timeout
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, host=host)
+
+    def _set_state(self, state):
+        self.state = state
+        CIRCUIT_STATE.set(self._GAUGE[state], host=self.host)
+
+    def allow(self):
+        """True if a call may go out now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self._open_for:
+                self._set_state(self.HALF_OPEN)
+                self._trial_running = False
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logging.info(f"{self.host} is answering again; circuit closed.")
+                self._set_state(self.CLOSED)
+            self.failures = 0
+            self._open_for = self.reset_timeout
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN:
+                self._open_for = min(MAX_RESET_TIMEOUT, self._open_for * 2)
+                self._open()
+            elif self.state == self.CLOSED and self.failures >= self.failure_threshold:
+                self._open()
+
+    def release(self):
+        """Ends a trial call that failed for reasons unrelated to the host."""
+        with self._lock:
+            self._trial_running = False
+
+    def _open(self):
+        self._set_state(self.OPEN)
+        self._opened_at = time.monotonic()
+        self._trial_running = False
+        logging.warning(f"{self.host} keeps failing ({self.failures} in a row); circuit open for {self._open_for:.0f}s.")
+
+    def snapshot(self):
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = round(max(0.0, self._opened_at + self._open_for - time.monotonic()), 1)
+            return {"state": self.state, "failures": self.failures, "retry_in": retry_in}
+
+
+def get_breaker(url):
+    """The circuit breaker for the URL's host (created on first use)."""
+    host = urlsplit(url).netloc
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(host)
+            if breaker is None:
+                breaker = _breakers[host] = CircuitBreaker(host, _failure_threshold, _reset_timeout)
+    return breaker
+
+def breaker_states():
+    """host -> {"state", "failures", "retry_in"} for every host called so far."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {b.host: b.snapshot() for b in breakers}
+
+def configure_resilience(max_retries=None, failure_threshold=None, reset_timeout=None):
+    """Sets the retry count and breaker tuning; existing breakers pick up the new values."""
+    global _max_retries, _failure_threshold, _reset_timeout
+    if max_retries is not None:
+        _max_retries = max(0, int(max_retries))
+    if failure_threshold is not None:
+        _failure_threshold = max(1, int(failure_threshold))
+    if reset_timeout is not None:
+        _reset_timeout = max(1.0, float(reset_timeout))
+    with _breakers_lock:
+        for breaker in _breakers.values():
+            breaker.failure_threshold = _failure_threshold
+            breaker.reset_timeout = _reset_timeout
+
+def _build_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_session():
+    """
+    Returns the process-wide requests.Session, so every call reuses pooled
+    keep-alive connections instead of paying a new TCP+TLS handshake.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session(DEFAULT_POOL_SIZE)
+    return _session
+
+def configure_session(pool_size):
+    """
+    Rebuilds the shared session with room for `pool_size` concurrent connections per host.
+    """
+    global _session
+    with _session_lock:
+        old = _session
+        _session = _build_session(max(1, pool_size))
+    if old is not None:
+        old.close()
+
+def _send(method, url, endpoint, **kwargs):
+    start = time.perf_counter()
+    try:
+        resp = get_session().request(method, url, **kwargs)
+    except Exception:
+        HTTP_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+        HTTP_REQUESTS.inc(endpoint=endpoint, status="exception")
+        HTTP_ERRORS.inc(endpoint=endpoint)
+        raise
+    HTTP_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+    HTTP_REQUESTS.inc(endpoint=endpoint, status=str(resp.status_code))
+    if resp.status_code >= 400:
+        HTTP_ERRORS.inc(endpoint=endpoint)
+    return resp
+
+def _backoff(attempt):
+    """Full-jitter exponential backoff, so parallel workers don't retry in lockstep."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+def _retry_after(resp):
+    """Seconds from a Retry-After header (delta or HTTP date), or None."""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def request(method, url, endpoint, idempotent=None, **kwargs):
+    """
+    Makes an HTTP request over the shared session, recording latency, status
+    and errors under `endpoint` (a short fixed name, not the URL).
+
+    Idempotent calls (GET/HEAD by default; pass idempotent=True for a safe
+    POST) are retried on timeouts, connection errors, 429 and 502/503/504,
+    with jittered backoff or after Retry-After when the server sends one (up
+    to MAX_RETRY_AFTER; longer waits are returned to the caller). Calls to a
+    host whose circuit is open raise CircuitOpenError without touching the
+    network.
+    """
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    retries = _max_retries if idempotent else 0
+    breaker = get_breaker(url)
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            CIRCUIT_REJECTED.inc(host=breaker.host)
+            raise CircuitOpenError(f"circuit open for {breaker.host}; skipped {endpoint}")
+        try:
+            resp = _send(method, url, endpoint, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            breaker.record_failure()
+            if attempt >= retries:
+                raise
+            wait = _backoff(attempt)
+        except Exception:
+            breaker.release()
+            raise
+        else:
+            if resp.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if resp.status_code not in RETRY_STATUSES or attempt >= retries:
+                return resp
+            wait = _retry_after(resp)
+            if wait is None:
+                wait = _backoff(attempt)
+            elif wait > MAX_RETRY_AFTER:
+                return resp
+            resp.close()
+        HTTP_RETRIES.inc(endpoint=endpoint)
+        attempt += 1
+        time.sleep(wait)
@@ -0,0 +1,149 @@
+# core/jsonstream.py
+
+import io
+import os
+import json
+
+# Optional faster parsers; stdlib json is always there as the fallback
+try:
+    import ijson
+    # The pure-Python ijson backend is slower than a full stdlib decode
+    if ijson.backend not in ("yajl2_c", "yajl2_cffi"):
+        ijson = None
+except ImportError:
+    ijson = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+AVAILABLE_BACKENDS = ("auto",) + tuple(
+    name for name, module in (("ijson", ijson), ("orjson", orjson), ("json", json)) if module is not None
+)
+
+# Small reads let a stream stop within a few items instead of after the whole buffer
+STREAM_BUF_SIZE = 2048
+
+_SCALAR_EVENTS = frozenset(("null", "boolean", "integer", "double", "number", "string"))
+_START_EVENTS = frozenset(("start_map", "start_array"))
+_END_EVENTS = frozenset(("end_map", "end_array"))
+
+
+def pick_backend(name=None):
+    """
+    Resolves a backend name ("auto", "ijson", "orjson" or "json", default
+    from PW_JSON_BACKEND) to one that is installed, else "auto".
+
+    "auto" decodes with orjson when it is installed (even with an early
+    stop, a full orjson decode is about as fast as streaming the first few
+    items). Without orjson it streams with ijson when the caller can stop
+    early, and otherwise decodes with stdlib json.
+    """
+    name = (name or os.environ.get("PW_JSON_BACKEND") or "auto").lower()
+    return name if name in AVAILABLE_BACKENDS else "auto"
+
+BACKEND = pick_backend()
+
+
+def loads(content, backend=None):
+    """Decodes a whole JSON document with the fastest installed full-document parser."""
+    if (backend or BACKEND) != "json" and orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def _project_stream(content, fields, nested, stop):
+    meta, items, item = {}, None, None
+    # (builder, dict, key, depth) while a field's list/object value is being built
+    capture = None
+    field_prefixes = {f"data.item.{f}": f for f in fields}
+    nested_prefixes = {f"data.item.{n}": n for n in nested}
+    sub_prefixes = {f"data.item.{n}.{k}": (n, k) for n, keys in nested.items() for k in keys}
+    events = ijson.parse(io.BytesIO(content), buf_size=STREAM_BUF_SIZE, use_float=True)
+    for prefix, event, value in events:
+        if capture is not None:
+            builder, target, key, depth = capture
+            builder.event(event, value)
+            depth += event in _START_EVENTS
+            depth -= event in _END_EVENTS
+            if depth:
+                capture = builder, target, key, depth
+            else:
+                target[key] = builder.value
+                capture = None
+        elif item is not None:
+            if prefix == "data.item" and event == "end_map":
+                if stop is not None and stop(item):
+                    return meta, items, True
+                items.append(item)
+                item = None
+            elif event == "start_map" and prefix in nested_prefixes:
+                name = nested_prefixes[prefix]
+                item[name] = dict.fromkeys(nested[name])
+            elif event in _SCALAR_EVENTS or event in _START_EVENTS:
+                # Same values as the decoded path: scalars as-is, lists/objects built whole
+                target, key = None, field_prefixes.get(prefix)
+                if key is not None:
+                    target = item
+                else:
+                    sub = sub_prefixes.get(prefix)
+                    if sub is not None and item[sub[0]] is not None:
+                        target, key = item[sub[0]], sub[1]
+                if target is None:
+                    continue
+                if event in _SCALAR_EVENTS:
+                    target[key] = value
+                else:
+                    builder = ijson.ObjectBuilder()
+                    builder.event(event, value)
+                    capture = builder, target, key, 1
+        elif prefix == "data.item" and event == "start_map" and items is not None:
+            item = dict.fromkeys(fields)
+            item.update(dict.fromkeys(nested))
+        elif prefix == "data" and event == "start_array":
+            items = []
+        elif prefix and "." not in prefix and event in _SCALAR_EVENTS:
+            meta[prefix] = value
+    return meta, items, False
+
+def _project_decoded(data, fields, nested, stop):
+    if not isinstance(data, dict):
+        return {}, None, False
+    meta = {k: v for k, v in data.items() if not isinstance(v, (dict, list))}
+    raw_items = data.get("data")
+    if not isinstance(raw_items, list):
+        return meta, None, False
+    items = []
+    for raw in raw_items:
+        if not isinstance(raw, dict):
+            continue
+        item = {f: raw.get(f) for f in fields}
+        for name, keys in nested.items():
+            sub = raw.get(name)
+            item[name] = {k: sub.get(k) for k in keys} if isinstance(sub, dict) else None
+        if stop is not None and stop(item):
+            return meta, items, True
+        items.append(item)
+    return meta, items, False
+
+def project_data(content, fields, nested=None, stop=None, backend=None):
+    """
+    Extracts only what the client uses from an API body shaped like
+    {"success": ..., "message": ..., "data": [ {...}, ... ]}.
+
+    Returns (meta, items, stopped):
+      meta    - the top-level scalar fields (success, message, ...)
+      items   - one dict per element of "data" holding just `fields`, plus each
+                `nested` name -> {subfield: value} (or None); None if "data"
+                isn't a list
+      stopped - True if stop(item) returned True; that item and everything
+                after it are left out (and, when streaming, never parsed)
+
+    When streaming stops early, top-level keys after "data" are not seen.
+    """
+    nested = nested or {}
+    backend = backend or BACKEND
+    stream = backend == "ijson" or (backend == "auto" and stop is not None and orjson is None)
+    if stream and ijson is not None:
+        return _project_stream(content, fields, nested, stop)
+    return _project_decoded(loads(content, backend), fields, nested, stop)
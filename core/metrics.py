@@ -0,0 +1,195 @@
+# core/metrics.py
+
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Seconds; suits HTTP round trips
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Seconds; suits "posted on PW" -> "delivered" lag
+LAG_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 21600, 86400)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_str(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def total(self):
+        """Sum over all label combinations."""
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_str(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    def set(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels."""
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            if idx < len(self.buckets):
+                series[idx] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, [('le', _number(float(bound)))])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {_number(series[-2])}")
+                lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "pw_http_requests_total", "HTTP requests made, by endpoint and status code.", ("endpoint", "status")))
+HTTP_ERRORS = REGISTRY.register(Counter(
+    "pw_http_errors_total", "HTTP requests that raised or returned a 4xx/5xx, by endpoint.", ("endpoint",)))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "pw_http_request_duration_seconds", "HTTP request latency, by endpoint.", ("endpoint",)))
+POLL_CYCLE = REGISTRY.register(Histogram(
+    "pw_poll_cycle_seconds", "Time to fetch and fan out all due batches in one loop turn."))
+DELIVERIES = REGISTRY.register(Counter(
+    "pw_deliveries_total", "Announcements handed to a sink, by sink and result.", ("sink", "result")))
+DELIVERY_LAG = REGISTRY.register(Histogram(
+    "pw_delivery_lag_seconds", "Announcement scheduleTime to successful delivery, by sink.", ("sink",),
+    buckets=LAG_BUCKETS))
+OUTBOX_PENDING = REGISTRY.register(Gauge(
+    "pw_outbox_pending", "Undelivered announcements waiting in the outbox, by sink.", ("sink",)))
+HTTP_RETRIES = REGISTRY.register(Counter(
+    "pw_http_retries_total", "HTTP requests retried after a timeout, connection error, 429 or 5xx, by endpoint.", ("endpoint",)))
+CIRCUIT_STATE = REGISTRY.register(Gauge(
+    "pw_circuit_state", "Circuit breaker state per host: 0 closed, 1 half-open, 2 open.", ("host",)))
+CIRCUIT_REJECTED = REGISTRY.register(Counter(
+    "pw_circuit_rejected_total", "Calls refused without touching the network because the host's circuit was open.", ("host",)))
+CONDITIONAL_REQUESTS = REGISTRY.register(Counter(
+    "pw_conditional_requests_total",
+    "Conditional first-page fetches, by batch and result (hit: unchanged and skipped, miss: downloaded).",
+    ("batch", "result")))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logging.debug("metrics: " + format % args)
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serves GET /metrics on http://host:port from a background thread. Returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info(f"Metrics endpoint listening on http://{host}:{server.server_port}/metrics")
+    return server
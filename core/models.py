@@ -0,0 +1,147 @@
+# core/models.py
+
+import sys
+import time
+from typing import Optional, List, Dict
+from core.utils import parse_api_epoch
+
+# Announcement._posted_at until scheduleTime has been parsed
+_UNPARSED = object()
+
+class Attachment:
+    """Image attached to an announcement. Shared, never mutated."""
+
+    __slots__ = ("name", "base_url", "key")
+
+    def __init__(self, name: Optional[str], base_url: Optional[str], key: Optional[str]):
+        self.name = name
+        self.base_url = base_url
+        self.key = key
+
+    @property
+    def url(self) -> Optional[str]:
+        if not (self.base_url and self.key):
+            return None
+        return self.base_url.rstrip("/") + "/" + self.key.lstrip("/")
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> Optional["Attachment"]:
+        if not data:
+            return None
+        return cls(data.get("name"), data.get("baseUrl"), data.get("key"))
+
+    def to_dict(self) -> Dict:
+        return {"name": self.name, "baseUrl": self.base_url, "key": self.key}
+
+
+class Announcement:
+    """
+    One announcement, as kept in memory between fetch and delivery.
+    Slotted so thousands of them stay small; scheduleTime is parsed into
+    `posted_at` (epoch seconds, None if missing or unparseable) the first
+    time something asks for it, so records that are only filtered out by _id
+    never pay for the parse, and everything downstream sorts and formats
+    from that.
+    """
+
+    __slots__ = ("id", "text", "schedule_time", "_posted_at", "attachment",
+                 "batch_id", "batch_slug", "batch_slugs")
+
+    def __init__(self, id: str, text: Optional[str], schedule_time: Optional[str],
+                 attachment: Optional[Attachment] = None, posted_at: Optional[int] = None,
+                 batch_id: Optional[str] = None, batch_slug: Optional[str] = None,
+                 batch_slugs: Optional[List[str]] = None):
+        self.id = id
+        self.text = text
+        self.schedule_time = schedule_time
+        self._posted_at = _UNPARSED if posted_at is None else posted_at
+        self.attachment = attachment
+        # Batch IDs and slugs repeat across every announcement of a batch
+        self.batch_id = sys.intern(batch_id) if batch_id else batch_id
+        self.batch_slug = sys.intern(batch_slug) if batch_slug else batch_slug
+        # Set by core.dedup when the same notice was posted to several batches
+        self.batch_slugs = batch_slugs or ()
+
+    @property
+    def posted_at(self) -> Optional[int]:
+        posted_at = self._posted_at
+        if posted_at is _UNPARSED:
+            posted_at = self._posted_at = parse_api_epoch(self.schedule_time)
+        return posted_at
+
+    def __repr__(self):
+        return f"Announcement(id={self.id!r}, posted_at={self.posted_at!r}, batch_slug={self.batch_slug!r})"
+
+    def sort_key(self):
+        """Oldest first; unparseable times go first. An int key, so sorting never compares strings."""
+        posted_at = self._posted_at
+        if posted_at is _UNPARSED:
+            posted_at = self.posted_at
+        return posted_at or 0
+
+    def notification_time(self) -> str:
+        """'01 May 2024, 10:00 AM' (UTC, as the API sends it), or the raw scheduleTime if it didn't parse."""
+        if self.posted_at is None:
+            return self.schedule_time or ""
+        return time.strftime("%d %b %Y, %I:%M %p", time.gmtime(self.posted_at))
+
+    @classmethod
+    def from_api(cls, data: Dict) -> "Announcement":
+        """Builds a record from one item of the announcements endpoint, dropping fields we don't use."""
+        # Slots set directly, as in for_batch: this runs for every item of every page
+        ann = cls.__new__(cls)
+        ann.id = data.get("_id")
+        ann.text = data.get("announcement")
+        ann.schedule_time = data.get("scheduleTime")
+        ann._posted_at = _UNPARSED
+        attachment = data.get("attachment")
+        ann.attachment = Attachment(attachment.get("name"), attachment.get("baseUrl"), attachment.get("key")) if attachment else None
+        ann.batch_id = ann.batch_slug = None
+        ann.batch_slugs = ()
+        return ann
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Announcement":
+        """Inverse of to_dict (also accepts the old plain-dict announcements)."""
+        return cls(
+            data.get("_id"),
+            data.get("announcement"),
+            data.get("scheduleTime"),
+            Attachment.from_dict(data.get("attachment")),
+            posted_at=data.get("posted_at"),
+            batch_id=data.get("batch_id"),
+            batch_slug=data.get("batch_slug"),
+            batch_slugs=list(data.get("batch_slugs") or []),
+        )
+
+    @classmethod
+    def coerce(cls, value) -> "Announcement":
+        """Returns `value` as an Announcement, converting a plain dict."""
+        return value if isinstance(value, cls) else cls.from_dict(value)
+
+    def to_dict(self) -> Dict:
+        """JSON-serializable form, using the API's field names."""
+        return {
+            "_id": self.id,
+            "announcement": self.text,
+            "scheduleTime": self.schedule_time,
+            "posted_at": self.posted_at,
+            "attachment": self.attachment.to_dict() if self.attachment else None,
+            "batch_id": self.batch_id,
+            "batch_slug": self.batch_slug,
+            "batch_slugs": list(self.batch_slugs),
+        }
+
+    def for_batch(self, batch_id: str, batch_slug: str) -> "Announcement":
+        """A copy tagged with the batch it was found in (a shared fetch is fanned out to several accounts)."""
+        # Slots copied directly: this runs once per announcement per subscriber
+        copy = Announcement.__new__(Announcement)
+        copy.id = self.id
+        copy.text = self.text
+        copy.schedule_time = self.schedule_time
+        copy._posted_at = self._posted_at
+        copy.attachment = self.attachment
+        copy.batch_id = sys.intern(batch_id) if batch_id else batch_id
+        copy.batch_slug = sys.intern(batch_slug) if batch_slug else batch_slug
+        copy.batch_slugs = ()
+        return copy
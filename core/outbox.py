@@ -0,0 +1,217 @@
+# core/outbox.py
+
+import json
+import time
+import random
+import sqlite3
+import threading
+from typing import List, Iterable, Optional
+from core.models import Announcement
+from core.utils import parse_api_epoch
+
+
+class Outbox:
+    """
+    Durable queue between detection and delivery. Announcements are
+    enqueued per sink (keyed by sink + announcement ID, so re-enqueueing is a
+    no-op), handed out oldest first, and only leave the queue once a send
+    succeeded. Failed sends are retried with jittered exponential backoff
+    until max_attempts, after which the item is parked as dead; an item the
+    platform rejects outright is marked dead straight away (mark_dead).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS outbox (
+            sink TEXT NOT NULL,
+            ann_id TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            schedule_time TEXT,
+            posted_at INTEGER,
+            enqueued_at REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            delivered_at REAL,
+            dead INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (sink, ann_id)
+        );
+    """
+    # Created after _migrate(), which adds posted_at to an outbox made before it existed
+    INDEXES = """
+        DROP INDEX IF EXISTS idx_outbox_pending;
+        CREATE INDEX IF NOT EXISTS idx_outbox_pending_posted
+            ON outbox (sink, delivered_at, dead, posted_at);
+    """
+
+    def __init__(self, filepath: str, base_delay: float = 30.0, max_delay: float = 60 * 60, max_attempts: int = 12):
+        self.filepath = filepath
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        # Used from both the poller and the dispatcher threads
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filepath, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self.SCHEMA)
+        self._migrate()
+        self._conn.executescript(self.INDEXES)
+
+    def _migrate(self):
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        if "posted_at" in columns:
+            return
+        rows = self._conn.execute(
+            "SELECT sink, ann_id, schedule_time FROM outbox WHERE schedule_time IS NOT NULL"
+        ).fetchall()
+        with self._conn:
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN posted_at INTEGER")
+            self._conn.executemany(
+                "UPDATE outbox SET posted_at = ? WHERE sink = ? AND ann_id = ?",
+                ((parse_api_epoch(schedule_time), sink, ann_id) for sink, ann_id, schedule_time in rows),
+            )
+
+    def enqueue(self, sink: str, announcements: Iterable[Announcement]) -> int:
+        """Adds announcements for a sink. Already-queued ones are ignored. Returns how many were added."""
+        now = time.time()
+        rows = [
+            (sink, ann.id, json.dumps(ann.to_dict()), ann.schedule_time, ann.posted_at, now, now)
+            for ann in announcements
+        ]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO outbox "
+                "(sink, ann_id, payload, schedule_time, posted_at, enqueued_at, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            return self._conn.total_changes - before
+
+    def due(self, sink: str, limit: int, now: Optional[float] = None) -> List[Announcement]:
+        """
+        Returns up to `limit` undelivered announcements for a sink that are
+        ready to send, oldest first. Items still backing off are skipped, so
+        one failing item never holds up the ones queued after it.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload FROM outbox "
+                "WHERE sink = ? AND delivered_at IS NULL AND dead = 0 AND next_attempt_at <= ? "
+                "ORDER BY posted_at, enqueued_at, ann_id LIMIT ?",
+                (sink, now, limit),
+            ).fetchall()
+        return [Announcement.from_dict(json.loads(payload)) for (payload,) in rows]
+
+    def next_attempt_time(self, sink: str) -> Optional[float]:
+        """When the next pending item for a sink may be tried, or None if nothing is pending."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox "
+                "WHERE sink = ? AND delivered_at IS NULL AND dead = 0",
+                (sink,),
+            ).fetchone()
+        return row[0]
+
+    def mark_delivered(self, sink: str, ann_ids: Iterable[str]):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE outbox SET delivered_at = ? WHERE sink = ? AND ann_id = ?",
+                ((now, sink, ann_id) for ann_id in ann_ids),
+            )
+
+    def add_batch_slug(self, sink: str, ann_id: str, slug: str) -> bool:
+        """
+        Adds a batch to the batch_slugs of a queued, undelivered announcement
+        (a duplicate of it turned up in another batch). Returns False if there
+        is no such item any more, e.g. because it was already delivered.
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT payload FROM outbox WHERE sink = ? AND ann_id = ? AND delivered_at IS NULL AND dead = 0",
+                (sink, ann_id),
+            ).fetchone()
+            if row is None:
+                return False
+            data = json.loads(row[0])
+            slugs = data.setdefault("batch_slugs", [])
+            if slug and slug not in slugs:
+                slugs.append(slug)
+                self._conn.execute(
+                    "UPDATE outbox SET payload = ? WHERE sink = ? AND ann_id = ?", (json.dumps(data), sink, ann_id)
+                )
+            return True
+
+    def _backoff(self, attempts: int) -> float:
+        # "Equal jitter": at least half the exponential delay, so retries spread out but never bunch at 0
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def mark_failed(self, sink: str, ann_ids: Iterable[str]) -> int:
+        """
+        Schedules a retry for each item, or marks it dead once it has used
+        max_attempts. Returns the number of items that went dead.
+        """
+        now = time.time()
+        dead = 0
+        with self._lock, self._conn:
+            for ann_id in ann_ids:
+                row = self._conn.execute(
+                    "SELECT attempts FROM outbox WHERE sink = ? AND ann_id = ?", (sink, ann_id)
+                ).fetchone()
+                if row is None:
+                    continue
+                attempts = row[0] + 1
+                if attempts >= self.max_attempts:
+                    dead += 1
+                    self._conn.execute(
+                        "UPDATE outbox SET attempts = ?, dead = 1 WHERE sink = ? AND ann_id = ?",
+                        (attempts, sink, ann_id),
+                    )
+                else:
+                    self._conn.execute(
+                        "UPDATE outbox SET attempts = ?, next_attempt_at = ? WHERE sink = ? AND ann_id = ?",
+                        (attempts, now + self._backoff(attempts), sink, ann_id),
+                    )
+        return dead
+
+    def mark_dead(self, sink: str, ann_ids: Iterable[str]) -> int:
+        """Parks items the platform will never accept (e.g. a 400 for a bad embed). Returns how many."""
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, dead = 1 WHERE sink = ? AND ann_id = ?",
+                ((sink, ann_id) for ann_id in ann_ids),
+            )
+            return self._conn.total_changes - before
+
+    def pending_count(self, sink: Optional[str] = None) -> int:
+        query = "SELECT COUNT(*) FROM outbox WHERE delivered_at IS NULL AND dead = 0"
+        params = ()
+        if sink is not None:
+            query += " AND sink = ?"
+            params = (sink,)
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()[0]
+
+    def purge_delivered(self, max_age_seconds: float) -> int:
+        """Deletes delivered items older than max_age_seconds. Returns the number removed."""
+        cutoff = time.time() - max_age_seconds
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "DELETE FROM outbox WHERE delivered_at IS NOT NULL AND delivered_at < ?", (cutoff,)
+            )
+            return cur.rowcount
+
+    def purge_dead(self, max_age_seconds: float) -> int:
+        """Deletes dead items enqueued more than max_age_seconds ago. Returns the number removed."""
+        cutoff = time.time() - max_age_seconds
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "DELETE FROM outbox WHERE dead = 1 AND enqueued_at < ?", (cutoff,)
+            )
+            return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,371 @@
+# core/poller.py
+
+import os
+import json
+import hashlib
+import time
+import logging
+import threading
+from core.announcer import fetch_new_announcements_many, DEFAULT_CONCURRENCY, DEFAULT_MAX_PAGES
+from core.tracker import open_id_store
+from core.batch_cache import BatchCache
+from core.outbox import Outbox
+from core.dedup import RollingDeduper
+from core.attachments import AttachmentCache
+from core.metrics import POLL_CYCLE
+from core.utils import forget_token, write_json_atomic
+from core.token_manager import build_token_manager, TOKEN_KEYS
+from notifier.dispatcher import Dispatcher
+from notifier.sinks import build_sinks
+
+# Config keys whose change means the sinks have to be rebuilt
+SINK_KEYS = ("webhook_url", "telegram_bot_token", "telegram_chat_id", "discord_template", "telegram_template")
+
+# How long delivered and dead outbox rows are kept (dead ones long enough to look into)
+OUTBOX_KEEP_DELIVERED = 7 * 24 * 60 * 60
+OUTBOX_KEEP_DEAD = 30 * 24 * 60 * 60
+
+
+class Account:
+    """
+    One student account, loaded from its own config.json: token, selected
+    batches, known-ID store, batch cache, outbox and sink dispatchers.
+    Relative file paths in the config resolve against the config's folder.
+    """
+
+    def __init__(self, config_path):
+        self.config_path = config_path
+        self.base_dir = os.path.dirname(os.path.abspath(config_path))
+        self.cfg = self._read_config()
+        self.name = self.cfg.get("name") or os.path.relpath(config_path)
+        self.token = self.cfg["token"]
+        self.selected_ids = set(self.cfg.get("selected_batch_ids") or [])
+        # Images are downloaded once at detection and uploaded to each platform once
+        cache_mb = float(self.cfg.get("attachment_cache_mb", 100))
+        self.attachments = AttachmentCache(
+            self._path(self.cfg.get("attachment_cache_dir", "attachment_cache")), int(cache_mb * 1024 * 1024)
+        ) if cache_mb > 0 else None
+        self.sinks = build_sinks(self.cfg, self.attachments)
+        # Open known announcement IDs (SQLite unless ids_file ends in .json)
+        self.known_ids = open_id_store(self._path(self.cfg.get("ids_file", "known_announcement_ids.db")))
+        self.batch_cache = BatchCache(
+            self._path(self.cfg.get("batch_cache_file", "batches_cache.json")),
+            float(self.cfg.get("batch_refresh_hours", 24)) * 60 * 60,
+        )
+        # Undelivered announcements survive restarts here; the dispatchers resume them on start
+        self.outbox = Outbox(self._path(self.cfg.get("outbox_file", "outbox.db")))
+        self.dispatchers = [Dispatcher(sink, self.outbox) for sink in self.sinks]
+        # Same notice posted to several batches -> one notification
+        self.deduper = RollingDeduper(float(self.cfg.get("dedup_window_hours", 24)) * 60 * 60)
+        self.retention = int(self.cfg.get("ids_retention_days", 180)) * 24 * 60 * 60
+        self.last_eviction = 0
+        self.batches = []
+        # Set to a reason string once the account can't be polled any more
+        self.disabled = None
+        # Set while a rejected token is being renewed; the account is skipped meanwhile
+        self.awaiting_token = False
+        # Called after a renewed token is swapped in (main.py wakes the loop with it)
+        self.on_token_renewed = None
+        self._cfg_lock = threading.Lock()
+        self.token_manager = build_token_manager(self)
+
+    def _path(self, path):
+        return os.path.join(self.base_dir, path)
+
+    def _read_config(self):
+        with open(self.config_path, "r") as f:
+            return json.load(f)
+
+    def save_config(self):
+        with self._cfg_lock:
+            write_json_atomic(self.config_path, self.cfg, indent=2)
+
+    @property
+    def paused(self):
+        return bool(self.cfg.get("paused", False))
+
+    def reload(self):
+        """
+        Re-reads config.json and applies it: pause toggle, token, batch
+        selection and sink targets all take effect without a restart.
+        Returns False if the file could not be read.
+        """
+        try:
+            cfg = self._read_config()
+        except (OSError, ValueError) as e:
+            logging.warning(f"[{self.name}] Could not re-read config: {e}")
+            return False
+        with self._cfg_lock:
+            old, self.cfg = self.cfg, cfg
+        if cfg.get("token") != old.get("token"):
+            self.token = cfg.get("token")
+            logging.info(f"[{self.name}] Token changed in config; using the new one.")
+            # The batch cache is tied to the old token, so the next refresh re-validates
+            self.disabled = None
+            self.awaiting_token = False
+            if self.token_manager:
+                self.token_manager.token_changed()
+        selected_ids = set(cfg.get("selected_batch_ids") or [])
+        if selected_ids != self.selected_ids:
+            self.selected_ids = selected_ids
+            logging.info(f"[{self.name}] Batch selection changed in config.")
+            self.disabled = None
+        if any(cfg.get(k) != old.get(k) for k in SINK_KEYS):
+            self._rebuild_sinks()
+        if any(cfg.get(k) != old.get(k) for k in TOKEN_KEYS):
+            self._rebuild_token_manager()
+        return True
+
+    def _rebuild_token_manager(self):
+        if self.token_manager:
+            self.token_manager.stop()
+        self.token_manager = build_token_manager(self)
+        if self.token_manager:
+            self.token_manager.start()
+            if self.awaiting_token:
+                self.token_manager.request_renewal()
+        logging.info(f"[{self.name}] Token renewal {'enabled' if self.token_manager else 'disabled'}.")
+
+    def _rebuild_sinks(self):
+        for dispatcher in self.dispatchers:
+            dispatcher.stop()
+        self.sinks = build_sinks(self.cfg, self.attachments)
+        # Pending items stay keyed by sink name, so the new dispatchers pick them up
+        self.dispatchers = [Dispatcher(sink, self.outbox).start() for sink in self.sinks]
+        logging.info(f"[{self.name}] Notification targets changed; now sending to {', '.join(s.name for s in self.sinks) or 'nothing'}.")
+
+    def disable(self, reason):
+        self.disabled = reason
+        logging.critical(f"[{self.name}] {reason}")
+
+    def token_rejected(self):
+        """
+        The token failed verification. With a token manager the account sits out
+        until a renewed token is swapped in; without one it is disabled.
+        """
+        if self.token_manager is None:
+            self.disable("Token invalid/expired. Update config.json with fresh token.")
+            return
+        if not self.awaiting_token:
+            logging.warning(f"[{self.name}] Token rejected; skipping this account until it is renewed.")
+        self.awaiting_token = True
+        self.token_manager.request_renewal()
+
+    def set_token(self, token, expires_in=None):
+        """Swaps in a renewed token and persists it. Requests already in flight finish with the old one."""
+        old = self.token
+        with self._cfg_lock:
+            self.cfg["token"] = token
+            self.cfg["token_expires_in"] = expires_in
+        self.token = token
+        self.awaiting_token = False
+        self.disabled = None
+        forget_token(old)
+        self.save_config()
+        if self.on_token_renewed:
+            self.on_token_renewed()
+
+    def start(self):
+        if self.token_manager:
+            self.token_manager.start()
+        for dispatcher in self.dispatchers:
+            dispatcher.start()
+            if dispatcher.pending():
+                logging.info(f"[{self.name}] Resuming delivery of {dispatcher.pending()} pending announcement(s) to {dispatcher.sink.name}.")
+
+    def close(self):
+        """Stops the background workers and closes the attachment cache. Undelivered items stay in the outbox."""
+        if self.token_manager:
+            self.token_manager.stop()
+        for dispatcher in self.dispatchers:
+            dispatcher.stop(timeout=5.0)
+        if self.attachments:
+            self.attachments.close()
+
+    def refresh_batches(self):
+        """
+        Updates self.batches from the batch cache (network only when stale).
+        Disables the account if the token is rejected or none of the selected
+        batches exist any more. Returns the batch cache result.
+        """
+        batches_resp = self.batch_cache.get(self.token)
+        if not batches_resp.get("success"):
+            if batches_resp.get("token_rejected"):
+                self.token_rejected()
+            else:
+                logging.error(f"[{self.name}] Fetching batches failed: {batches_resp.get('error_message')}")
+            return batches_resp
+        purchased_batches = batches_resp.get("batches", [])
+        self.batches = [b for b in purchased_batches if b["_id"] in self.selected_ids]
+        if not self.batches:
+            # Wipe selection so user is prompted again on restart
+            self.cfg["selected_batch_ids"] = []
+            self.selected_ids = set()
+            self.save_config()
+            self.disable("None of your selected batches are found. Re-select needed.")
+        return batches_resp
+
+    def new_for_batch(self, batch, announcements):
+        """
+        Takes announcements fetched for one of this account's batches and
+        returns the ones it hasn't seen, tagged with the batch.
+        """
+        # Copied, since a shared fetch hands the same records to every subscriber
+        bslug = batch.get("slug") or batch["name"]
+        return [ann.for_batch(batch["_id"], bslug) for ann in announcements if ann.id not in self.known_ids]
+
+    def publish(self, new_anns):
+        """
+        Queues one poll's new announcements (across all batches) on every sink,
+        with cross-batch duplicates collapsed, and records them all as known.
+        Returns the number of notifications queued.
+        """
+        if not new_anns:
+            return 0
+        to_send, dropped, merged = self.deduper.collapse(new_anns)
+        if dropped:
+            logging.info(f"[{self.name}] Collapsed {dropped} duplicate announcement(s) posted to several batches.")
+        if self.attachments:
+            self.attachments.prefetch(ann.attachment.url for ann in to_send if ann.attachment)
+        # Durably queue first, then mark known: a crash in between just re-queues (a no-op)
+        for dispatcher in self.dispatchers:
+            # A later duplicate joins its earlier notification if that is still queued, else goes out itself
+            late = [ann for ann, first_id in merged
+                    if not self.outbox.add_batch_slug(dispatcher.sink.name, first_id, ann.batch_slug)]
+            dispatcher.submit(to_send + late)
+        # record the new IDs, duplicates included (incremental insert, not a full rewrite)
+        self.known_ids.add_announcements(new_anns)
+        return len(to_send)
+
+    def housekeeping(self):
+        # Eviction scans the whole table, so only do it about once a day
+        if time.time() - self.last_eviction <= 24 * 60 * 60:
+            return
+        self.last_eviction = time.time()
+        if self.retention > 0:
+            evicted = self.known_ids.evict_older_than(self.retention)
+            if evicted:
+                logging.info(f"[{self.name}] Evicted {evicted} known ID(s) older than {self.cfg.get('ids_retention_days')} days.")
+        self.outbox.purge_delivered(OUTBOX_KEEP_DELIVERED)
+        purged = self.outbox.purge_dead(OUTBOX_KEEP_DEAD)
+        if purged:
+            logging.info(f"[{self.name}] Purged {purged} undeliverable announcement(s) from the outbox.")
+
+
+def _validator_key(batch_id, subs):
+    """
+    Key for a batch's first-page validators, specific to the accounts
+    polling it. If one sits out a poll (paused, waiting for a token), the
+    others' polls must not make the page look unchanged to it when it is back.
+    """
+    paths = sorted(os.path.abspath(a.config_path) for a in subs)
+    return f"{batch_id}:{hashlib.sha1(chr(0).join(paths).encode()).hexdigest()[:12]}"
+
+
+class _KnownByAll:
+    """
+    Known-ID view over several stores: an ID counts as known only once every
+    subscriber has it, so a shared fetch walks far enough for all of them.
+    """
+
+    def __init__(self, stores):
+        self.stores = stores
+
+    def __contains__(self, ann_id):
+        return all(ann_id in store for store in self.stores)
+
+    def has_batch(self, batch_id):
+        return all(store.has_batch(batch_id) for store in self.stores)
+
+
+class Poller:
+    """
+    Polls the batches of one or more accounts through a single scheduler.
+    A batch tracked by several accounts is fetched once, with any one
+    subscriber's token, and the result is fanned out to each of them.
+    """
+
+    def __init__(self, accounts, scheduler, concurrency=DEFAULT_CONCURRENCY, max_pages=DEFAULT_MAX_PAGES):
+        self.accounts = list(accounts)
+        self.scheduler = scheduler
+        self.concurrency = concurrency
+        self.max_pages = max_pages
+        self._subscribers = {}  # batch_id -> [Account]
+
+    def start(self):
+        for account in self.accounts:
+            account.start()
+
+    def active_accounts(self):
+        return [a for a in self.accounts if not a.disabled and not a.paused and not a.awaiting_token]
+
+    def all_disabled(self):
+        return all(a.disabled for a in self.accounts)
+
+    def refresh(self):
+        """Refreshes every active account's batches and re-syncs the scheduler with their union."""
+        subscribers = {}
+        batches = {}
+        for account in self.active_accounts():
+            account.refresh_batches()
+            if account.disabled:
+                continue
+            for batch in account.batches:
+                subscribers.setdefault(batch["_id"], []).append(account)
+                batches.setdefault(batch["_id"], batch)
+        self._subscribers = subscribers
+        self.scheduler.sync(list(batches.values()))
+
+    def poll_due(self):
+        """Fetches every due batch once and fans the results out. Returns the number of notifications queued."""
+        due = self.scheduler.pop_due()
+        jobs, polled = [], []
+        for batch in due:
+            subs = [a for a in self._subscribers.get(batch["_id"], []) if not a.disabled and not a.paused and not a.awaiting_token]
+            if not subs:
+                self.scheduler.record(batch["_id"], found_new=False)
+                continue
+            known = subs[0].known_ids if len(subs) == 1 else _KnownByAll([a.known_ids for a in subs])
+            jobs.append((subs[0].token, batch["_id"], known, _validator_key(batch["_id"], subs)))
+            polled.append((batch, subs))
+        logging.info(f"Checking new announcements from {len(jobs)} due batch(es)...")
+
+        cycle_start = time.perf_counter()
+        results = fetch_new_announcements_many(jobs, max_workers=self.concurrency, max_pages=self.max_pages)
+        total_new = 0
+        found = {}  # Account -> new announcements from every batch polled this turn
+        for (batch, subs), ann_resp in zip(polled, results):
+            bslug = batch.get("slug") or batch["name"]
+            if not ann_resp.get("success"):
+                logging.warning(f"Failed to fetch announcements for {bslug}: {ann_resp.get('error_message')}")
+                if ann_resp.get("token_rejected"):
+                    # The token of the subscriber the fetch was made with
+                    subs[0].token_rejected()
+                if ann_resp.get("error_status") == 404:
+                    # Batch may have been removed or renamed; refresh the list next round
+                    for account in subs:
+                        account.batch_cache.invalidate()
+                self.scheduler.record_failure(batch["_id"])
+                continue
+            if ann_resp.get("truncated"):
+                logging.warning(f"First poll of {bslug}: stopped after {self.max_pages} page(s); older announcements are not sent.")
+            # Already filtered down to IDs unseen by at least one subscriber
+            anns = ann_resp.get("announcements", [])
+            self.scheduler.record(batch["_id"], found_new=bool(anns))
+            for account in subs:
+                new_anns = account.new_for_batch(batch, anns)
+                if new_anns:
+                    logging.info(f"[{account.name}] {len(new_anns)} new announcement(s) in {bslug}.")
+                    found.setdefault(account, []).extend(new_anns)
+        # Publish per account once everything is in, so cross-batch duplicates can be merged
+        for account, new_anns in found.items():
+            queued = account.publish(new_anns)
+            logging.info(f"[{account.name}] {queued} notification(s) queued for {', '.join(s.name for s in account.sinks)}.")
+            total_new += queued
+        if jobs:
+            POLL_CYCLE.observe(time.perf_counter() - cycle_start)
+        return total_new
+
+    def housekeeping(self):
+        for account in self.accounts:
+            account.housekeeping()
@@ -0,0 +1,174 @@
+# core/scheduler.py
+
+import heapq
+import itertools
+import time
+from core.utils import parse_api_time
+
+def is_batch_dormant(batch, now=None):
+    """
+    True if the batch hasn't started yet or its endDate/expiryDate has passed,
+    i.e. it is unlikely to post announcements.
+    """
+    now = time.time() if now is None else now
+    start = parse_api_time(batch.get("startDate"))
+    if start is not None and start > now:
+        return True
+    for key in ("endDate", "expiryDate"):
+        end = parse_api_time(batch.get(key))
+        if end is not None and end < now:
+            return True
+    return False
+
+
+class BatchScheduler:
+    """
+    Gives every tracked batch its own polling interval, kept in a heap keyed
+    by next-due time. A batch that just posted something is polled again
+    after min_interval; each quiet poll doubles its interval up to
+    max_interval, and dormant batches go straight to max_interval.
+    """
+
+    def __init__(self, base_interval, min_interval=None, max_interval=None):
+        self.base_interval = base_interval
+        self.min_interval = min(min_interval or base_interval, base_interval)
+        self.max_interval = max(max_interval or base_interval, base_interval)
+        self._heap = []
+        self._seq = itertools.count()
+        self._batches = {}    # batch_id -> batch dict
+        self._intervals = {}  # batch_id -> current interval (seconds)
+        self._due = {}        # batch_id -> next due time (epoch)
+        self._failures = {}   # batch_id -> consecutive failed polls
+        self._saved = {}      # batch_id -> (due, interval) from a checkpoint, used when it is synced
+        self._dirty = set()   # batch_ids rescheduled since the last take_changes()
+        self._removed = set()
+
+    def __len__(self):
+        return len(self._batches)
+
+    def set_intervals(self, base_interval, min_interval=None, max_interval=None, now=None):
+        """
+        Applies new interval settings. Current per-batch intervals are clamped
+        into the new range, and batches due later than that allows are pulled in.
+        """
+        now = time.time() if now is None else now
+        self.base_interval = base_interval
+        self.min_interval = min(min_interval or base_interval, base_interval)
+        self.max_interval = max(max_interval or base_interval, base_interval)
+        for batch_id, interval in self._intervals.items():
+            interval = min(max(interval, self.min_interval), self.max_interval)
+            self._intervals[batch_id] = interval
+            due = self._due.get(batch_id)
+            if due is not None and due > now + interval:
+                self._push(batch_id, now + interval)
+
+    def _push(self, batch_id, due):
+        self._due[batch_id] = due
+        self._dirty.add(batch_id)
+        heapq.heappush(self._heap, (due, next(self._seq), batch_id))
+
+    def sync(self, batches, now=None):
+        """
+        Makes the scheduled set match `batches`: new batches are due
+        immediately (or when a restored checkpoint says), missing ones are
+        dropped, existing ones keep their timing.
+        """
+        now = time.time() if now is None else now
+        wanted = {b["_id"]: b for b in batches}
+        for batch_id in list(self._batches):
+            if batch_id not in wanted:
+                del self._batches[batch_id]
+                self._intervals.pop(batch_id, None)
+                self._due.pop(batch_id, None)
+                self._failures.pop(batch_id, None)
+                self._dirty.discard(batch_id)
+                self._removed.add(batch_id)
+        for batch_id, batch in wanted.items():
+            if batch_id not in self._batches:
+                due, interval = self._saved.pop(batch_id, (now, self.base_interval))
+                interval = min(max(interval, self.min_interval), self.max_interval)
+                self._intervals[batch_id] = interval
+                # A checkpoint can't push a batch out further than its interval allows
+                self._push(batch_id, min(max(due, now), now + interval))
+                self._removed.discard(batch_id)
+            self._batches[batch_id] = batch
+
+    def restore(self, saved):
+        """
+        Takes checkpointed timing, {batch_id: (due, interval)}, for batches
+        not synced yet, so a restart carries on with each batch's schedule
+        instead of polling everything at once.
+        """
+        for batch_id, (due, interval) in saved.items():
+            if batch_id not in self._batches:
+                self._saved[batch_id] = (float(due), float(interval))
+
+    def take_changes(self):
+        """
+        Returns what changed since the last call, for checkpointing:
+        ([(batch_id, due, interval), ...], [removed batch_id, ...]). Batches
+        popped but not recorded yet are left for the next call.
+        """
+        changed = [(b, self._due[b], self._intervals[b]) for b in self._dirty if b in self._due]
+        self._dirty.difference_update(b for b, _, _ in changed)
+        removed, self._removed = list(self._removed), set()
+        return changed, removed
+
+    def mark_all_due(self, now=None):
+        """Makes every scheduled batch due now (e.g. a manual "poll now")."""
+        now = time.time() if now is None else now
+        for batch_id, due in list(self._due.items()):
+            if due > now:
+                self._push(batch_id, now)
+
+    def pop_due(self, now=None):
+        """
+        Removes and returns the batches that are due, in due order. Each one
+        must be handed back through record() to be scheduled again.
+        """
+        now = time.time() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            when, _, batch_id = heapq.heappop(self._heap)
+            # Skip stale heap entries for removed or rescheduled batches
+            if self._due.get(batch_id) != when:
+                continue
+            del self._due[batch_id]
+            due.append(self._batches[batch_id])
+        return due
+
+    def record(self, batch_id, found_new, now=None):
+        """Reschedules a polled batch based on whether the poll found anything new."""
+        if batch_id not in self._batches:
+            return
+        now = time.time() if now is None else now
+        self._failures.pop(batch_id, None)
+        if is_batch_dormant(self._batches[batch_id], now):
+            interval = self.max_interval
+        elif found_new:
+            interval = self.min_interval
+        else:
+            interval = min(self._intervals[batch_id] * 2, self.max_interval)
+        self._intervals[batch_id] = interval
+        self._push(batch_id, now + interval)
+
+    def record_failure(self, batch_id, now=None):
+        """
+        Reschedules a batch whose poll failed (timeout, 5xx, open circuit).
+        A failure says nothing about how active the batch is, so its interval
+        is kept; the retry comes after min_interval, doubling per consecutive
+        failure but never later than the batch's own interval.
+        """
+        if batch_id not in self._batches:
+            return
+        now = time.time() if now is None else now
+        failures = self._failures[batch_id] = self._failures.get(batch_id, 0) + 1
+        delay = min(self.min_interval * 2 ** (failures - 1), self._intervals[batch_id])
+        self._push(batch_id, now + delay)
+
+    def seconds_until_next(self, now=None):
+        """Seconds until the next batch is due (0 if one already is), or None if nothing is scheduled."""
+        now = time.time() if now is None else now
+        if not self._due:
+            return None
+        return max(0, min(self._due.values()) - now)
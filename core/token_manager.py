@@ -0,0 +1,208 @@
+# core/token_manager.py
+
+import sys
+import json
+import time
+import base64
+import shlex
+import logging
+import threading
+import subprocess
+from core.utils import get_token_expiry_info
+from core.generate_token import send_otp, get_token
+
+# Config keys that decide how (and whether) a token is renewed
+TOKEN_KEYS = ("interactive_token_renewal", "token_command", "token_renew_before_hours")
+
+# Only one OTP prompt on the terminal at a time, whichever account asks
+_prompt_lock = threading.Lock()
+
+
+def expiry_epoch(expires_in):
+    """
+    Epoch seconds from the `expires_in` get_token returns (epoch milliseconds;
+    epoch seconds or a plain duration in seconds are accepted too), or None.
+    """
+    try:
+        value = float(expires_in)
+    except (TypeError, ValueError):
+        return None
+    if value <= 0:
+        return None
+    if value > 1e11:
+        return value / 1000
+    if value > 1e9:
+        return value
+    return time.time() + value
+
+def jwt_expiry(token):
+    """The `exp` claim of a JWT access token (unverified), or None if it isn't one."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+
+# --- Credential providers ---
+# A provider is any callable(account) returning get_token's shape:
+# {"success": True, "access_token": str, "expires_in": int} or an error dict.
+
+def prompt_otp(account):
+    """Interactive renewal: sends an OTP to the account's phone and reads it from the terminal."""
+    if sys.stdin is None or not sys.stdin.isatty():
+        return {"success": False, "error_message": "interactive token renewal needs a terminal", "error_status": None}
+    with _prompt_lock:
+        phone = account.cfg.get("phone") or input(f"[{account.name}] Phone number for token renewal: ").strip()
+        country_code = account.cfg.get("country_code") or "+91"
+        sent = send_otp(phone, country_code)
+        if not sent.get("success"):
+            return sent
+        otp = input(f"[{account.name}] Enter the OTP sent to {phone}: ").strip()
+        return get_token(phone, otp)
+
+
+class CommandProvider:
+    """
+    Runs an external command for a fresh token. It must print either JSON
+    ({"access_token": ..., "expires_in": ...}) or just the token.
+    """
+
+    def __init__(self, command, timeout=120):
+        self.command = command
+        self.timeout = timeout
+
+    def __call__(self, account):
+        try:
+            proc = subprocess.run(shlex.split(self.command), capture_output=True, text=True, timeout=self.timeout)
+        except (OSError, subprocess.SubprocessError) as e:
+            return {"success": False, "error_message": str(e), "error_status": None}
+        output = proc.stdout.strip()
+        if proc.returncode != 0 or not output:
+            return {"success": False, "error_message": f"token command exited {proc.returncode}: {proc.stderr.strip()}", "error_status": None}
+        try:
+            data = json.loads(output)
+        except ValueError:
+            data = {"access_token": output}
+        if not isinstance(data, dict) or not data.get("access_token"):
+            return {"success": False, "error_message": "token command printed no access_token", "error_status": None}
+        return {"success": True, "access_token": data["access_token"], "expires_in": data.get("expires_in")}
+
+
+def build_token_provider(cfg):
+    """The credential provider an account config asks for, or None (renew by hand)."""
+    if cfg.get("token_command"):
+        return CommandProvider(cfg["token_command"])
+    if cfg.get("interactive_token_renewal"):
+        return prompt_otp
+    return None
+
+
+class TokenManager:
+    """
+    Keeps one account's token alive. Knows when it expires (from the
+    `expires_in` get_token returned, else the JWT's exp claim), renews it
+    renew_before seconds ahead from a background thread, and renews at once
+    when the API rejects it. The new token is swapped into the account in one
+    step, so polling carries on with no restart.
+    """
+
+    RETRY_DELAY = 15 * 60
+    MAX_RETRY_DELAY = 6 * 60 * 60
+
+    def __init__(self, account, provider, renew_before=24 * 60 * 60):
+        self.account = account
+        self.provider = provider
+        self.renew_before = renew_before
+        self.expires_at = None
+        self.failures = 0
+        self._retry_at = 0.0
+        self._requested = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopped = False
+        self.token_changed()
+
+    def token_changed(self):
+        """Re-reads the expiry after the account's token was replaced (renewed here or edited in config)."""
+        self.expires_at = expiry_epoch(self.account.cfg.get("token_expires_in")) or jwt_expiry(self.account.token)
+        self._wake.set()
+
+    def seconds_left(self):
+        """Seconds until the token expires, or None if unknown."""
+        return None if self.expires_at is None else self.expires_at - time.time()
+
+    def _due_in(self):
+        now = time.time()
+        if self._requested:
+            return max(0.0, self._retry_at - now)
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - self.renew_before - now, self._retry_at - now)
+
+    def start(self):
+        if self._thread is None:
+            left = self.seconds_left()
+            if left is not None:
+                logging.info(f"[{self.account.name}] Token expires in {left / 86400:.1f} day(s); renewing {self.renew_before / 3600:g}h ahead.")
+            self._thread = threading.Thread(target=self._run, name=f"{self.account.name}-token", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def request_renewal(self):
+        """Asks for a renewal as soon as possible (the API rejected the token)."""
+        self._requested = True
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopped:
+            wait = self._due_in()
+            if wait is None or wait > 0:
+                # Re-check hourly, so a long sleep can't overshoot after a clock jump
+                self._wake.wait(3600 if wait is None else min(wait, 3600))
+                self._wake.clear()
+                continue
+            self.renew()
+
+    def renew(self):
+        """Gets a new token from the provider and swaps it in. Returns True on success."""
+        with self._lock:
+            name = self.account.name
+            logging.info(f"[{name}] Renewing access token...")
+            try:
+                result = self.provider(self.account)
+            except Exception as e:
+                result = {"success": False, "error_message": str(e)}
+            if not result.get("success"):
+                self.failures += 1
+                delay = min(self.MAX_RETRY_DELAY, self.RETRY_DELAY * 2 ** (self.failures - 1))
+                self._retry_at = time.time() + delay
+                logging.error(f"[{name}] Token renewal failed: {result.get('error_message')}. Retrying in {delay / 60:.0f} min.")
+                return False
+            self.failures = 0
+            self._retry_at = 0.0
+            self._requested = False
+            self.account.set_token(result["access_token"], result.get("expires_in"))
+            self.token_changed()
+            expires_in = result.get("expires_in")
+            if isinstance(expires_in, (int, float)) and expires_in > 1e11:
+                info = get_token_expiry_info(expires_in)
+                logging.info(f"[{name}] Token renewed; valid for {info['days_remaining']} more day(s).")
+            else:
+                logging.info(f"[{name}] Token renewed.")
+            return True
+
+
+def build_token_manager(account):
+    """A TokenManager for the account, or None if its config has no way to renew tokens."""
+    provider = build_token_provider(account.cfg)
+    if provider is None:
+        return None
+    renew_before = float(account.cfg.get("token_renew_before_hours", 24)) * 60 * 60
+    return TokenManager(account, provider, renew_before)
@@ -1,7 +1,13 @@
 # core/tracker.py
 
+import os
 import json
-from typing import List, Set, Dict
+import time
+import sqlite3
+import threading
+from typing import List, Set, Iterable, Optional
+from core.models import Announcement
+from core.utils import write_json_atomic, parse_api_epoch
 
 def load_known_ids(filepath: str) -> Set[str]:
     """Load known announcement IDs from a file."""
@@ -13,13 +19,205 @@ def load_known_ids(filepath: str) -> Set[str]:
 
 def save_known_ids(known_ids: Set[str], filepath: str):
     """Save known announcement IDs to a file."""
-    with open(filepath, "w") as f:
-        json.dump(list(known_ids), f)
+    write_json_atomic(filepath, list(known_ids))
 
-def get_new_announcements(fetched_announcements: List[Dict], known_ids: Set[str]) -> List[Dict]:
+def get_new_announcements(fetched_announcements: List[Announcement], known_ids: Set[str]) -> List[Announcement]:
     """Return only the announcements that are new (not in known_ids)."""
-    return [ann for ann in fetched_announcements if ann["_id"] not in known_ids]
+    return [ann for ann in fetched_announcements if ann.id not in known_ids]
 
-def update_known_ids(fetched_announcements: List[Dict], known_ids: Set[str]) -> Set[str]:
+def update_known_ids(fetched_announcements: List[Announcement], known_ids: Set[str]) -> Set[str]:
     """Update the set of known IDs with IDs from the latest fetch."""
-    return known_ids.union({ann["_id"] for ann in fetched_announcements})
+    return known_ids.union({ann.id for ann in fetched_announcements})
+
+
+# --- Known-ID stores ---
+# Both backends support `ann_id in store`, add_announcements, has_batch,
+# high_water_mark, evict_older_than and close, so main.py doesn't care which one it has.
+
+class JsonIdStore:
+    """
+    Legacy backend: the whole ID set lives in memory and the JSON file is
+    rewritten on every change. Keeps no per-batch metadata, so there is
+    nothing to evict and no high-water marks, and has_batch() only knows the
+    batches added to since start-up (until then max_pages caps every walk).
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._ids = load_known_ids(filepath)
+        self._batches = set()  # batches added to since start-up
+        # Writers (e.g. the export's seeding threads) must not rewrite the file over each other
+        self._lock = threading.Lock()
+
+    def __contains__(self, ann_id) -> bool:
+        return ann_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add_announcements(self, announcements: Iterable[Announcement]):
+        with self._lock:
+            for ann in announcements:
+                self._ids.add(ann.id)
+                if ann.batch_id:
+                    self._batches.add(ann.batch_id)
+            save_known_ids(self._ids, self.filepath)
+
+    def has_batch(self, batch_id: str) -> bool:
+        # The file has no per-batch metadata, so only batches recorded since start-up count
+        return batch_id in self._batches
+
+    def high_water_mark(self, batch_id: str) -> Optional[int]:
+        return None
+
+    def evict_older_than(self, max_age_seconds: float, keep_per_batch: int = 0) -> int:
+        return 0
+
+    def close(self):
+        pass
+
+
+class SqliteIdStore:
+    """
+    Indexed SQLite backend. Inserts are incremental, so the cost of a cycle
+    depends on how many announcements are new, not on how many were ever seen.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS known_announcements (
+            id TEXT PRIMARY KEY,
+            batch_id TEXT,
+            schedule_time TEXT,
+            posted_at INTEGER,
+            seen_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_known_seen_at
+            ON known_announcements (seen_at);
+    """
+    # Created after _migrate(), which adds posted_at to a store made before it existed
+    INDEXES = """
+        DROP INDEX IF EXISTS idx_known_batch_time;
+        CREATE INDEX IF NOT EXISTS idx_known_batch_posted
+            ON known_announcements (batch_id, posted_at);
+    """
+
+    def __init__(self, filepath: str, import_from: Optional[str] = None):
+        self.filepath = filepath
+        # Lookups happen from the fetch worker threads, so share one connection behind a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filepath, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self.SCHEMA)
+        self._migrate()
+        self._conn.executescript(self.INDEXES)
+        if import_from and os.path.isfile(import_from) and len(self) == 0:
+            self._import_ids(load_known_ids(import_from))
+
+    def _migrate(self):
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(known_announcements)")}
+        if "posted_at" in columns:
+            return
+        rows = self._conn.execute(
+            "SELECT id, schedule_time FROM known_announcements WHERE schedule_time IS NOT NULL"
+        ).fetchall()
+        with self._conn:
+            self._conn.execute("ALTER TABLE known_announcements ADD COLUMN posted_at INTEGER")
+            self._conn.executemany(
+                "UPDATE known_announcements SET posted_at = ? WHERE id = ?",
+                ((parse_api_epoch(schedule_time), ann_id) for ann_id, schedule_time in rows),
+            )
+
+    def _import_ids(self, ids: Iterable[str]):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO known_announcements (id, seen_at) VALUES (?, ?)",
+                ((ann_id, now) for ann_id in ids),
+            )
+
+    def __contains__(self, ann_id) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM known_announcements WHERE id = ?", (ann_id,)
+            ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM known_announcements").fetchone()[0]
+
+    def add_announcements(self, announcements: Iterable[Announcement]):
+        now = time.time()
+        rows = [(ann.id, ann.batch_id, ann.schedule_time, ann.posted_at, now) for ann in announcements]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO known_announcements (id, batch_id, schedule_time, posted_at, seen_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def has_batch(self, batch_id: str) -> bool:
+        """
+        True if any ID is known for the batch. IDs imported from a legacy
+        JSON file have no batch and don't count: they still stop a walk that
+        reaches them, but can't tell a batch that was polled before from one
+        that was just selected.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM known_announcements WHERE batch_id = ? LIMIT 1", (batch_id,)
+            ).fetchone()
+        return row is not None
+
+    def high_water_mark(self, batch_id: str) -> Optional[int]:
+        """Latest posted_at (epoch seconds) seen for a batch, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(posted_at) FROM known_announcements WHERE batch_id = ?", (batch_id,)
+            ).fetchone()
+        return row[0]
+
+    def evict_older_than(self, max_age_seconds: float, keep_per_batch: int = 50) -> int:
+        """
+        Deletes IDs first seen more than max_age_seconds ago. The newest
+        keep_per_batch IDs of each batch are always kept, so a page the poller
+        can still reach never looks new again. IDs imported from a legacy JSON
+        file have no batch, so nothing says whether a poll can still reach
+        them; they are never evicted. Returns the number removed.
+        """
+        cutoff = time.time() - max_age_seconds
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                """
+                DELETE FROM known_announcements
+                WHERE seen_at < ?
+                  AND batch_id IS NOT NULL
+                  AND id NOT IN (
+                    SELECT id FROM (
+                      SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY batch_id ORDER BY posted_at DESC
+                      ) AS rn
+                      FROM known_announcements
+                      WHERE batch_id IS NOT NULL
+                    ) WHERE rn <= ?
+                  )
+                """,
+                (cutoff, keep_per_batch),
+            )
+            return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_id_store(filepath: str):
+    """
+    Opens the known-ID store for `filepath`: a .json path keeps the legacy
+    JSON backend, anything else is SQLite. A new SQLite store imports the
+    IDs from a sibling .json file of the same name, if there is one.
+    """
+    root, ext = os.path.splitext(filepath)
+    if ext.lower() == ".json":
+        return JsonIdStore(filepath)
+    return SqliteIdStore(filepath, import_from=root + ".json")
@@ -1,8 +1,13 @@
+import os
+import json
 import uuid
-import requests
 import time
+import threading
+from datetime import datetime, timezone
+from core.http import request
 
-BASE_URL = "https://api.penpencil.co"
+# Overridable so the offline benchmark (bench/) can point at a local mock server
+BASE_URL = os.environ.get("PW_API_BASE_URL", "https://api.penpencil.co")
 ORGANIZATION_ID = "5eb393ee95fab7468a79d189"
 REFERER = "https://www.pw.live/"
 CONTENT_TYPE = "application/json"
@@ -13,6 +18,15 @@ GRANT_TYPE = "password"
 LATITUDE = 0
 LONGITUDE = 0
 
+# How long a successful verify-token result is trusted before re-checking
+TOKEN_VERIFY_TTL = 30 * 60
+
+# token -> monotonic time of the last successful verification
+_token_verified_at = {}
+# token -> lock held while that token is being verified (the global lock only guards the dicts)
+_token_locks = {}
+_token_verify_lock = threading.Lock()
+
 def get_default_headers(random_id=None):
     if not random_id:
         random_id = str(uuid.uuid4())
@@ -32,7 +46,7 @@ def verify_token(token):
     url = f"{BASE_URL}/v3/oauth/verify-token"
     headers = get_auth_headers(token)
     try:
-        resp = requests.post(url, headers=headers, timeout=10)
+        resp = request("POST", url, "verify_token", idempotent=True, headers=headers, timeout=10)
         data = resp.json()
         if data.get("success") and data.get("data", {}).get("isVerified"):
             return {"success": True}
@@ -45,7 +59,66 @@ def verify_token(token):
             }
     except Exception as e:
         return {"success": False, "error_message": str(e), "error_status": None}
-    
+
+def verify_token_cached(token, ttl=None):
+    """
+    Same result as verify_token, but skips the network call if the token was
+    verified successfully within the last `ttl` seconds.
+    """
+    if ttl is None:
+        ttl = TOKEN_VERIFY_TTL
+    with _token_verify_lock:
+        token_lock = _token_locks.setdefault(token, threading.Lock())
+    # Serialised per token, so concurrent fetches don't all verify the same token
+    # at once, while a slow verification never holds up other accounts' tokens
+    with token_lock:
+        verified_at = _token_verified_at.get(token)
+        if verified_at is not None and time.monotonic() - verified_at < ttl:
+            return {"success": True}
+        result = verify_token(token)
+        if result.get("success"):
+            _token_verified_at[token] = time.monotonic()
+        else:
+            _token_verified_at.pop(token, None)
+        return result
+
+def invalidate_token(token):
+    """
+    Forget the cached verification for a token, so the next call re-verifies it.
+    Call this when the API rejects the token with 401/403.
+    """
+    _token_verified_at.pop(token, None)
+
+def forget_token(token):
+    """Drops everything cached for a token that won't be used again (e.g. replaced by a renewed one)."""
+    with _token_verify_lock:
+        _token_verified_at.pop(token, None)
+        _token_locks.pop(token, None)
+
+def set_token_verify_ttl(seconds):
+    global TOKEN_VERIFY_TTL
+    TOKEN_VERIFY_TTL = seconds
+
+def write_json_atomic(filepath, data, **dump_kwargs):
+    """
+    Writes JSON to a temporary file next to `filepath`, flushes it to disk
+    and renames it over the original, so a crash mid-write leaves either
+    the old file or the new one, never half of each.
+    """
+    tmp = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, filepath)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
 def get_token_expiry_info(expires_in):
     current_time_ms = int(time.time() * 1000)
     ms_remaining = expires_in - current_time_ms
@@ -55,3 +128,20 @@ def get_token_expiry_info(expires_in):
         "is_expired": is_expired,
         "days_remaining": days_remaining if not is_expired else 0
     }
+
+def parse_api_time(value):
+    """Parses an API ISO time (e.g. '2024-05-01T10:00:00.000Z') to an epoch, or None."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+def parse_api_epoch(value):
+    """parse_api_time as whole seconds (the posted_at stored on records and in the databases), or None."""
+    posted = parse_api_time(value)
+    return int(posted) if posted is not None else None
@@ -1,33 +1,74 @@
 import os
 import json
-import time
 import logging
+import argparse
+import time
+import signal
+import threading
 
-from core.announcer import fetch_batches, fetch_announcements
-from core.tracker import (
-    load_known_ids,
-    save_known_ids,
-    get_new_announcements,
-    update_known_ids,
-    
+from core.announcer import (
+    fetch_all_batches,
+    get_conditional_stats,
+    get_page_validators,
+    restore_page_validators,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_MAX_PAGES,
 )
-from notifier.discord_noti import send_discord_announcements
+from core.http import configure_session, configure_resilience
+from core.utils import set_token_verify_ttl, write_json_atomic
+from core.scheduler import BatchScheduler
+from core.batch_cache import BatchCache
+from core.tracker import open_id_store
+from core.exporter import export_announcements, open_writer, EXPORT_FORMATS
+from core.checkpoint import StateCheckpoint
+from core.poller import Account, Poller
+from core.config_watch import ConfigWatcher
+from core.control import Controller, start_control_server
+from core.metrics import start_metrics_server
+from notifier.sinks import build_sinks
 
 CONFIG_FILE = "config.json"
 TEMPLATE_CONFIG = {
     "webhook_url": "YOUR_DISCORD_WEBHOOK",
     "token": "YOUR_ACCESS_TOKEN_HERE",
-    "ids_file": "known_announcement_ids.json",
+    "telegram_bot_token": "",
+    "telegram_chat_id": "",
+    "discord_template": "{text}",  # fields: {text} {time} {batch} {batches} {batches_line} {id}
+    "telegram_template": "<b>PW team</b>\nNotification time: <i>{time}</i>\n{batches_line}\n<b>{text}</b>",
+    "ids_file": "known_announcement_ids.db",
+    "ids_retention_days": 180,
+    "batch_cache_file": "batches_cache.json",
+    "batch_refresh_hours": 24,
+    "outbox_file": "outbox.db",
+    "state_file": "poll_state.db",  # per-batch schedule and ETags, so a restart picks up where it stopped
+    "attachment_cache_dir": "attachment_cache",
+    "attachment_cache_mb": 100,  # images uploaded once per platform, then reused; 0 disables
+    "dedup_window_hours": 24,  # collapse the same notice posted to several batches; 0 disables
     "frequency_minutes": 30,
+    "min_frequency_minutes": 5,
+    "max_frequency_minutes": 720,
+    "token_verify_ttl_minutes": 30,
+    "max_concurrency": 8,
+    "max_pages_per_poll": 5,
+    "http_max_retries": 2,  # per GET, on timeouts / 429 / 502-504, with jittered backoff
+    "circuit_failure_threshold": 5,  # consecutive failures before a host is skipped for a while
+    "circuit_reset_seconds": 30,
     "paused": False,
+    "control_port": 8765,  # local control endpoint (127.0.0.1); 0 disables it
+    "shutdown_drain_seconds": 30,
+    "metrics_port": 0,  # standalone Prometheus /metrics port; /metrics is also on the control endpoint
     "selected_batch_ids": [],  # Will be filled during selection
-    "interactive_token_renewal": False
+    "interactive_token_renewal": False,  # renew the token with an OTP typed into this terminal
+    "phone": "",  # used by interactive renewal; asked for if empty
+    "country_code": "+91",
+    "token_command": "",  # or: a command printing {"access_token": ..., "expires_in": ...}
+    "token_renew_before_hours": 24,
+    "token_expires_in": None  # filled in on renewal
 }
 
 def ensure_config():
     if not os.path.isfile(CONFIG_FILE):
-        with open(CONFIG_FILE, "w") as f:
-            json.dump(TEMPLATE_CONFIG, f, indent=2)
+        write_json_atomic(CONFIG_FILE, TEMPLATE_CONFIG, indent=2)
         print(
             f"\nconfig.json was not found, so a template has been created at {CONFIG_FILE}.\n"
             f"Please open it, fill in your Discord webhook URL and access token before running this script again.\n"
@@ -41,8 +82,7 @@ def load_config():
         return json.load(f)
 
 def save_config(cfg):
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(cfg, f, indent=2)
+    write_json_atomic(CONFIG_FILE, cfg, indent=2)
 
 def log_setup():
     logging.basicConfig(
@@ -59,7 +99,7 @@ def select_batches(token, cfg):
     Let user select which PW batches to track.
     """
     print("\nFetching your PW batches...")
-    batches_resp = fetch_batches(token)
+    batches_resp = fetch_all_batches(token)
     if not batches_resp.get("success"):
         print(f"Could not fetch batches for selection: {batches_resp.get('error_message')}")
         exit(1)
@@ -88,115 +128,281 @@ def select_batches(token, cfg):
     print(f"\nSaved batch IDs: {selected_ids} to config.json.\nRestart the script.")
     exit(0)
 
-def main():
-    log_setup()
-    cfg = load_config()
-    webhook_url = cfg["webhook_url"]
-    ids_file = cfg["ids_file"]
-    frequency = int(cfg.get("frequency_minutes", 30)) * 60
-    paused = bool(cfg.get("paused", False))
-    token = cfg["token"]
+def load_tenants(path):
+    """
+    Loads a tenants file: process-wide settings (frequency_minutes,
+    max_concurrency, ...) plus an "accounts" list of per-account config.json
+    paths, relative to the tenants file.
+    """
+    with open(path, "r") as f:
+        tenants = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    accounts = []
+    for account_path in tenants.get("accounts", []):
+        account = Account(os.path.join(base_dir, account_path))
+        if not account.sinks or not account.token or account.token.startswith("YOUR_"):
+            logging.critical(f"[{account.name}] config is not set up (token and a webhook/Telegram target needed). Skipping.")
+            continue
+        if not account.selected_ids:
+            logging.critical(f"[{account.name}] No batches selected. Run main.py once in that account's folder to select. Skipping.")
+            continue
+        accounts.append(account)
+    return tenants, accounts
 
-    if not webhook_url or not token or token.startswith("YOUR_"):
+def load_single_account(cfg):
+    """
+    Sets up the classic one-account mode from config.json, running batch
+    selection first if needed.
+    """
+    token = cfg["token"]
+    if not build_sinks(cfg) or not token or token.startswith("YOUR_"):
         logging.critical(
-            "config.json is not set up. Please fill in your 'webhook_url' and 'token' with actual values."
+            "config.json is not set up. Please fill in your 'token' and a 'webhook_url' "
+            "(and/or 'telegram_bot_token' + 'telegram_chat_id') with actual values."
         )
         exit(1)
     # Check for batch selection - if not done, do it now
     if not cfg.get("selected_batch_ids"):
         select_batches(token, cfg)
-    selected_ids = set(cfg["selected_batch_ids"])
-
-    # Load known announcement IDs
-    known_ids = load_known_ids(ids_file)
+    account = Account(CONFIG_FILE)
 
     # FIRST, test token is *actually* accepted for fetching batches
-    batches_resp = fetch_batches(token)
+    # (skipped when a fresh cached list fetched with this token exists)
+    batches_resp = account.refresh_batches()
+    if account.awaiting_token and account.token_manager.renew():
+        batches_resp = account.refresh_batches()
+    if account.awaiting_token:
+        logging.critical("Token invalid/expired and could not be renewed. Update config.json with fresh token.")
+        exit(1)
     if not batches_resp.get("success"):
-        error = batches_resp.get("error_status")
-        if error in [401, 403]:
-            logging.critical("Your access token was rejected by fetch_batches. Update config.json with a fresh token.")
-        else:
+        if not account.disabled:
             logging.error(f"Failed to fetch batches: {batches_resp.get('error_message')}")
         exit(1)
-    purchased_batches = batches_resp.get("batches", [])
-    # Filter only the selected batches
-    batches_to_track = [b for b in purchased_batches if b["_id"] in selected_ids]
-    if not batches_to_track:
-        logging.critical("No matching batches found for your selected IDs. Reselect with a valid token.")
-        # Wipe selection so user is prompted again on restart
-        cfg["selected_batch_ids"] = []
-        save_config(cfg)
+    if account.disabled:
         exit(1)
+    return account
 
-    logging.info("Notifier started. Ctrl+C to stop.")
-    while True:
+def parse_args():
+    parser = argparse.ArgumentParser(description="Forward PW batch announcements to Discord/Telegram.")
+    parser.add_argument(
+        "--tenants",
+        metavar="FILE",
+        help="poll many accounts in one process; FILE lists their config.json paths",
+    )
+    commands = parser.add_subparsers(dest="command")
+    export = commands.add_parser(
+        "export",
+        help="write the full announcement history of batches to JSONL or SQLite (resumable)",
+    )
+    export.add_argument("output", help="file to write: .jsonl, or .db / .sqlite for SQLite")
+    export.add_argument("--format", choices=EXPORT_FORMATS, help="override the format guessed from the extension")
+    export.add_argument("--config", default=CONFIG_FILE, help="account config.json with the token (default: %(default)s)")
+    export.add_argument(
+        "--batch", action="append", dest="batch_ids", metavar="ID",
+        help="export this batch (repeatable); default: the config's selected batches",
+    )
+    export.add_argument("--all-batches", action="store_true", help="export every purchased batch")
+    export.add_argument(
+        "--seed", action="store_true",
+        help="also mark everything exported as known (records earlier runs wrote included), "
+             "so the notifier starts without sending the backlog",
+    )
+    export.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="batches exported at once")
+    export.add_argument("--max-pages", type=int, help="stop each batch after this many pages; the next run continues")
+    export.add_argument("--fresh", action="store_true", help="discard the progress of an earlier run and start over")
+    return parser.parse_args()
+
+def export_command(args):
+    """
+    `main.py export`: streams every announcement page of the chosen batches
+    into a file, resuming an interrupted run. Exits 1 if any batch failed.
+    """
+    with open(args.config, "r") as f:
+        cfg = json.load(f)
+    token = cfg.get("token")
+    if not token or token.startswith("YOUR_"):
+        logging.critical(f"No token in {args.config}.")
+        exit(1)
+    base_dir = os.path.dirname(os.path.abspath(args.config))
+    configure_session(args.concurrency)
+    configure_resilience(
+        max_retries=cfg.get("http_max_retries", 2),
+        failure_threshold=cfg.get("circuit_failure_threshold", 5),
+        reset_timeout=cfg.get("circuit_reset_seconds", 30),
+    )
+    batch_cache = BatchCache(
+        os.path.join(base_dir, cfg.get("batch_cache_file", "batches_cache.json")),
+        float(cfg.get("batch_refresh_hours", 24)) * 60 * 60,
+    )
+    batches_resp = batch_cache.get(token)
+    if not batches_resp.get("success"):
+        logging.critical(f"Failed to fetch batches: {batches_resp.get('error_message')}")
+        exit(1)
+    batches = batches_resp["batches"]
+    if not args.all_batches:
+        wanted = set(args.batch_ids or cfg.get("selected_batch_ids") or [])
+        batches = [b for b in batches if b["_id"] in wanted]
+    if not batches:
+        logging.critical("No batches to export. Pass --batch ID, --all-batches, or select batches first.")
+        exit(1)
+
+    seed_stores = []
+    if args.seed:
+        seed_stores.append(open_id_store(os.path.join(base_dir, cfg.get("ids_file", "known_announcement_ids.db"))))
+    writer = open_writer(args.output, args.format, fresh=args.fresh)
+    logging.info(f"Exporting {len(batches)} batch(es) to {args.output}...")
+    try:
+        results = export_announcements(token, batches, writer, seed_stores, args.concurrency, args.max_pages)
+    finally:
+        writer.close()
+        for store in seed_stores:
+            store.close()
+    failed = [batch_id for batch_id, result in results.items() if not result["success"]]
+    unfinished = [batch_id for batch_id, result in results.items() if not result["done"]]
+    written = sum(result["written"] for result in results.values())
+    logging.info(f"Export finished: {written} new record(s); {len(unfinished)} batch(es) left to resume.")
+    exit(1 if failed else 0)
+
+def read_settings(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+def apply_settings(cfg, scheduler, poller):
+    """
+    Applies the process-wide settings that can change while running.
+    Returns the base polling interval in seconds.
+    """
+    frequency = int(cfg.get("frequency_minutes", 30)) * 60
+    set_token_verify_ttl(int(cfg.get("token_verify_ttl_minutes", 30)) * 60)
+    scheduler.set_intervals(
+        frequency,
+        min_interval=int(cfg.get("min_frequency_minutes", 5)) * 60,
+        max_interval=int(cfg.get("max_frequency_minutes", 720)) * 60,
+    )
+    poller.max_pages = int(cfg.get("max_pages_per_poll", DEFAULT_MAX_PAGES))
+    configure_resilience(
+        max_retries=cfg.get("http_max_retries", 2),
+        failure_threshold=cfg.get("circuit_failure_threshold", 5),
+        reset_timeout=cfg.get("circuit_reset_seconds", 30),
+    )
+    return frequency
+
+def main():
+    args = parse_args()
+    log_setup()
+    if args.command == "export":
+        export_command(args)
+    if args.tenants:
+        settings_file = args.tenants
+        cfg, accounts = load_tenants(settings_file)
+        if not accounts:
+            logging.critical("No usable accounts in the tenants file. Exiting.")
+            exit(1)
+    else:
+        settings_file = CONFIG_FILE
         cfg = load_config()
-        if cfg.get("paused", False):
-            logging.info("Paused - sleeping...")
-            time.sleep(frequency)
-            continue
+        accounts = [load_single_account(cfg)]
 
-        logging.info("Checking new announcements from selected batches...")
+    # Process-wide settings (from config.json, or the tenants file in tenant mode).
+    # max_concurrency sizes the shared connection pool, so it needs a restart to change.
+    concurrency = int(cfg.get("max_concurrency", DEFAULT_CONCURRENCY))
+    # One connection pool shared by every account
+    configure_session(concurrency)
+    scheduler = BatchScheduler(int(cfg.get("frequency_minutes", 30)) * 60)
+    poller = Poller(accounts, scheduler, concurrency=concurrency)
+    frequency = apply_settings(cfg, scheduler, poller)
+    # Carry on with each batch's schedule from the last run instead of polling everything at once
+    # Relative to the settings file, like the account paths in a tenants file
+    state_file = os.path.join(os.path.dirname(os.path.abspath(settings_file)), cfg.get("state_file", "poll_state.db"))
+    checkpoint = StateCheckpoint(state_file)
+    saved_at = checkpoint.saved_at()
+    if saved_at is not None:
+        schedule = checkpoint.load_schedule()
+        scheduler.restore(schedule)
+        restore_page_validators(checkpoint.load_validators())
+        logging.info(f"Resuming the schedule of {len(schedule)} batch(es) from {(time.time() - saved_at) / 60:.0f} min ago.")
+    poller.start()
 
-        # If batches could change, re-fetch every round:
-        batches_resp = fetch_batches(token)
-        if not batches_resp.get("success"):
-            logging.error(f"Fetching batches failed: {batches_resp.get('error_message')}")
-            if batches_resp.get("error_status") in [401, 403]:
-                logging.critical("Token invalid/expired. Update config.json with fresh token.")
-                exit(1)
-            time.sleep(frequency)
+    # Config edits, control commands and renewed tokens wake the loop straight away
+    controller = Controller(poller, scheduler)
+    for account in accounts:
+        account.on_token_renewed = controller.wake.set
+    watcher = ConfigWatcher([settings_file] + [a.config_path for a in accounts], controller.wake).start()
+    settings_path = os.path.abspath(settings_file)
+    control_port = int(cfg.get("control_port", 0) or 0)
+    if control_port:
+        start_control_server(controller, control_port)
+    metrics_port = int(cfg.get("metrics_port", 0) or 0)
+    if metrics_port:
+        start_metrics_server(metrics_port)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: controller.shutdown())
+
+    logging.info(f"Notifier started for {len(accounts)} account(s). Ctrl+C to stop.")
+    try:
+        run_loop(controller, poller, scheduler, checkpoint, watcher, settings_file, settings_path, frequency)
+    finally:
+        watcher.stop()
+        checkpoint.save(scheduler, get_page_validators())
+        checkpoint.close()
+        # Give queued sends a chance to go out; anything left stays in the outbox
+        controller.stop(float(cfg.get("shutdown_drain_seconds", 30)))
+
+def run_loop(controller, poller, scheduler, checkpoint, watcher, settings_file, settings_path, frequency):
+    """
+    The polling loop. Never sleeps blindly: every wait returns early on a
+    config change or control command, and it returns on shutdown.
+    """
+    accounts = poller.accounts
+    while not controller.stopping:
+        changed = watcher.pop_changed()
+        for account in accounts:
+            if os.path.abspath(account.config_path) in changed:
+                account.reload()
+        if settings_path in changed:
+            try:
+                frequency = apply_settings(read_settings(settings_file), scheduler, poller)
+                logging.info("Settings reloaded.")
+            except (OSError, ValueError) as e:
+                logging.warning(f"Could not reload settings: {e}")
+
+        if poller.all_disabled():
+            logging.critical("No account can be polled any more. Exiting.")
+            exit(1)
+        if controller.paused or not poller.active_accounts():
+            logging.info("Paused or waiting for token renewal - sleeping...")
+            controller.wait(frequency)
             continue
-        purchased_batches = batches_resp.get("batches", [])
-        batches_to_track = [b for b in purchased_batches if b["_id"] in selected_ids]
-        if not batches_to_track:
-            logging.critical("None of your selected batches are found. Re-select needed. Exiting.")
-            cfg["selected_batch_ids"] = []
-            save_config(cfg)
+
+        # Served from disk until batch_refresh_hours passes or a batch 404s
+        poller.refresh()
+        if poller.all_disabled():
+            logging.critical("No account can be polled any more. Exiting.")
             exit(1)
+        if controller.take_poll_request():
+            logging.info("Poll requested; checking every batch now.")
+            scheduler.mark_all_due()
 
-        all_new = []
-        for batch in batches_to_track:
-            bid = batch["_id"]
-            bslug = batch.get("slug") or batch["name"]
-            ann_resp = fetch_announcements(token, bid)
-            if not ann_resp.get("success"):
-                logging.warning(f"Failed to fetch announcements for {bslug}: {ann_resp.get('error_message')}")
-                continue
-            fetched_anns = ann_resp.get("announcements", [])
-            new_anns = get_new_announcements(fetched_anns, known_ids)
-            if new_anns:
-                for new_ann in new_anns:
-                    new_ann['batch_slug'] = bslug
-                all_new.extend(new_anns)
-
-        if all_new:
-            logging.info(f"{len(all_new)} new announcement(s) found. Sending to Discord, one at a time...")
-            results = []
-            for ann in sorted(all_new, key=lambda x: x.get("scheduleTime", "")):
-                try:
-                    ok = send_discord_announcements(webhook_url, [ann])[0]  # Should be True/False
-                except Exception as e:
-                    logging.error(f"Discord send failed: {e}")
-                    ok = False
-                if not ok:
-                    logging.warning("A Discord send failed (bad webhook, network, or embed error).")
-                time.sleep(1)  # ADDS A DELAY TO PREVENT RATE LIMIT
-                results.append(ok)
-            if all(results):
-                logging.info("All new announcements sent to Discord.")
-            else:
-                failed_count = results.count(False)
-                logging.warning(f"{failed_count} announcement(s) failed to send.")
-            # update known IDs
-            known_ids = update_known_ids(all_new, known_ids)
-            save_known_ids(known_ids, ids_file)
-        else:
+        new_count = poller.poll_due()
+        checkpoint.save(scheduler, get_page_validators())
+
+        stats = get_conditional_stats()
+        hits = sum(st["hits"] for st in stats.values())
+        total = hits + sum(st["misses"] for st in stats.values())
+        if total:
+            logging.info(f"Unchanged first pages skipped so far: {hits}/{total}.")
+
+        if not new_count:
             logging.info("No new announcements.")
 
-        logging.info(f"Sleeping for {cfg['frequency_minutes']} minutes...\n")
-        time.sleep(frequency)
+        poller.housekeeping()
+
+        # Wake for the next due batch, but at least once per frequency
+        wait = scheduler.seconds_until_next()
+        wait = frequency if wait is None else min(wait, frequency)
+        logging.info(f"Sleeping for {wait / 60:.1f} minutes...\n")
+        controller.wait(wait)
+    logging.info("Shutting down.")
 
 if __name__ == "__main__":
     try:
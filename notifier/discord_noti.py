@@ -1,64 +1,65 @@
-import requests
-import random
-from datetime import datetime
+import json
+from core.http import request
+from core.models import Announcement
+from notifier.render import DiscordRenderer, group_embeds, PW_LOGO_URL
 
-def get_random_color():
-    """Returns a random integer in the Discord embed color range."""
-    return random.randint(0, 0xFFFFFF)
+# Discord accepts at most 10 embeds (and 10 files) per webhook message
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_FILES_PER_MESSAGE = 10
 
+DEFAULT_RENDERER = DiscordRenderer()
 
-def send_discord_announcement(webhook_url, announcement):
+
+def build_discord_embeds(announcement, renderer=None):
     """
-    Sends a single announcement to Discord via webhook, formatted with PW team profile and time at the top.
+    Builds the Discord embeds for one announcement, with PW team profile and
+    time at the top: one embed, plus continuation embeds if the text is
+    longer than an embed's description allows. The result is shared with
+    the render cache, so copy before changing it.
     """
-    # Announcement text
-    description = announcement.get("announcement", "New Announcement")
-
-    # Format notification time
-    try:
-        dt = datetime.fromisoformat(announcement.get("scheduleTime", "")[:-1])
-        notification_time = dt.strftime("%d %b %Y, %I:%M %p")
-    except Exception:
-        notification_time = announcement.get("scheduleTime", "")
+    return (renderer or DEFAULT_RENDERER).render(announcement)
 
-    # Image (if any)
-    image_url = None
-    attachment = announcement.get("attachment")
-    if attachment and attachment.get("baseUrl") and attachment.get("key"):
-        image_url = attachment["baseUrl"].rstrip("/") + "/" + attachment["key"].lstrip("/")
-
-    # Build the embed
-    embed = {
-        "author": {
-            "name": "PW team",
-            "icon_url": "https://www.pw.live/study/assets/icons/logo.png"
-        },
-        "description": description,
-         "color": get_random_color(),
-        "fields": [
-            {
-                "name": "Notification Time",
-                "value": notification_time,
-                "inline": False
-            }
-        ]
-    }
-    if image_url:
-        embed["image"] = {"url": image_url}
+def build_discord_embed(announcement):
+    """
+    Builds the (first) Discord embed for one announcement, with PW team profile and time at the top.
+    """
+    return dict(build_discord_embeds(announcement)[0])
 
+def post_discord_embeds(webhook_url, embeds, files=None):
+    """
+    Posts up to MAX_EMBEDS_PER_MESSAGE embeds as one webhook message.
+    `files` is an optional list of (filename, bytes, content_type) uploaded
+    with it, which the embeds can point at as attachment://filename; the
+    message is then sent with ?wait=true so the response lists the uploaded
+    attachments' CDN URLs.
+    Returns the raw response so callers can read the rate-limit headers.
+    """
     payload = {
-        "embeds": [embed]
+        "embeds": list(embeds)
     }
+    if not files:
+        return request("POST", webhook_url, "discord_webhook", json=payload, timeout=10)
+    multipart = {f"files[{i}]": file for i, file in enumerate(files)}
+    multipart["payload_json"] = (None, json.dumps(payload), "application/json")
+    return request("POST", webhook_url, "discord_webhook", params={"wait": "true"}, files=multipart, timeout=30)
 
-    response = requests.post(webhook_url, json=payload)
-    return response.ok
+def send_discord_announcement(webhook_url, announcement):
+    """
+    Sends a single announcement to Discord via webhook, formatted with PW team profile and time at the top.
+    """
+    for embeds in group_embeds(build_discord_embeds(announcement)):
+        response = post_discord_embeds(webhook_url, embeds)
+        if not response.ok:
+            return False
+    return True
 
 def send_discord_announcements(webhook_url, announcements):
     """
     Sends multiple announcements one by one to Discord in chronological order (oldest first).
     """
     results = []
-    for announcement in sorted(announcements, key=lambda x: x.get("scheduleTime", "")):
+    announcements = [Announcement.coerce(ann) for ann in announcements]
+    for announcement in sorted(announcements, key=Announcement.sort_key):
         result = send_discord_announcement(webhook_url, announcement)
         results.append(result)
     return results
@@ -0,0 +1,179 @@
+# notifier/dispatcher.py
+
+import time
+import logging
+import threading
+from core.metrics import DELIVERIES, DELIVERY_LAG, OUTBOX_PENDING
+
+# Outcomes of Sink.deliver()
+SENT = "sent"          # the platform accepted the pack
+RETRY = "retry"        # worth trying again later (network error, 5xx, 429s that outlasted the retries)
+REJECTED = "rejected"  # a 4xx other than 429: sending the same payload again won't help
+
+
+class TokenBucket:
+    """
+    Rate limiter whose budget follows the X-RateLimit-* headers the platform
+    actually sends. Until the first response arrives it assumes `capacity`
+    requests per `per` seconds (Discord webhooks default to 5 per 2s).
+    """
+
+    def __init__(self, capacity=5, per=2.0):
+        self.capacity = capacity
+        self.rate = capacity / per
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Blocks until a request may be sent, then takes one token."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def block_for(self, seconds):
+        """Sends nothing for `seconds` (e.g. a 429 retry_after)."""
+        with self._lock:
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers):
+        """Re-syncs the bucket with X-RateLimit-Limit/Remaining/Reset-After."""
+        try:
+            limit = int(headers["X-RateLimit-Limit"])
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset_after = float(headers["X-RateLimit-Reset-After"])
+        except (KeyError, TypeError, ValueError):
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.capacity = max(1, limit)
+            if reset_after > 0:
+                self.rate = self.capacity / reset_after
+            self.tokens = min(self.tokens, float(remaining))
+            if remaining <= 0:
+                self.blocked_until = max(self.blocked_until, now + reset_after)
+
+
+class Dispatcher:
+    """
+    Delivers announcements to one Sink from its own background thread, so
+    polling never waits on sends and a slow sink never holds up another.
+    Work comes from a durable Outbox: items go out oldest first, packed up to
+    sink.max_batch per request, and are only marked delivered after the
+    platform accepted them. A pack the platform rejects outright is sent
+    again one announcement at a time, so only the item that caused the
+    rejection is dead-lettered.
+    """
+
+    # Longest the worker sleeps before re-checking the outbox on its own
+    IDLE_WAIT = 30.0
+
+    def __init__(self, sink, outbox):
+        self.sink = sink
+        self.outbox = outbox
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopped = False
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"{self.sink.name}-dispatch", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=30.0):
+        """Stops the worker after its current send. Undelivered items stay in the outbox."""
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, announcements):
+        """Queues announcements for delivery (idempotent per announcement ID) and wakes the worker."""
+        added = self.outbox.enqueue(self.sink.name, announcements)
+        self.pending()  # keeps the pending gauge current
+        self._wake.set()
+        return added
+
+    def pending(self):
+        count = self.outbox.pending_count(self.sink.name)
+        OUTBOX_PENDING.set(count, sink=self.sink.name)
+        return count
+
+    def drain(self, timeout=None):
+        """Waits until nothing deliverable is pending. Returns True if drained."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            self._wake.set()
+            time.sleep(0.1)
+        return True
+
+    def _wait_time(self):
+        next_at = self.outbox.next_attempt_time(self.sink.name)
+        if next_at is None:
+            return self.IDLE_WAIT
+        return min(self.IDLE_WAIT, max(0.0, next_at - time.time()))
+
+    def _run(self):
+        name = self.sink.name
+        while not self._stopped:
+            pack = self.outbox.due(name, self.sink.max_batch)
+            if not pack:
+                self._wake.wait(self._wait_time())
+                self._wake.clear()
+                continue
+            outcome = self._deliver(pack)
+            if outcome == REJECTED:
+                # One bad item fails the whole pack: find it by sending each on its own
+                for ann in pack:
+                    self._settle([ann], self._deliver([ann]), isolated=True)
+            else:
+                self._settle(pack, outcome)
+            self.pending()
+
+    def _deliver(self, pack):
+        try:
+            return self.sink.deliver(pack)
+        except Exception as e:
+            logging.error(f"{self.sink.name} send failed: {e}")
+            return RETRY
+
+    def _settle(self, pack, outcome, isolated=False):
+        """Records a send's outcome in the outbox."""
+        name = self.sink.name
+        ids = [ann.id for ann in pack]
+        if outcome == SENT:
+            self.outbox.mark_delivered(name, ids)
+            DELIVERIES.inc(len(pack), sink=name, result="ok")
+            now = time.time()
+            for ann in pack:
+                if ann.posted_at is not None:
+                    DELIVERY_LAG.observe(max(0.0, now - ann.posted_at), sink=name)
+        elif outcome == REJECTED and isolated:
+            DELIVERIES.inc(len(pack), sink=name, result="rejected")
+            self.outbox.mark_dead(name, ids)
+            logging.error(f"{name} rejected announcement {ids[0]}; giving up on it.")
+        else:
+            DELIVERIES.inc(len(pack), sink=name, result="failed")
+            dead = self.outbox.mark_failed(name, ids)
+            logging.warning(f"{name} send failed for {len(pack)} announcement(s); will retry.")
+            if dead:
+                logging.error(f"Giving up on {dead} announcement(s) after repeated {name} failures.")
@@ -0,0 +1,258 @@
+# notifier/render.py
+
+import os
+import re
+import html
+import string
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from core.models import Announcement
+
+PW_LOGO_URL = os.environ.get("PW_LOGO_URL", "https://www.pw.live/study/assets/icons/logo.png")
+
+# Platform limits (characters)
+DISCORD_DESCRIPTION_LIMIT = 4096
+DISCORD_FIELD_LIMIT = 1024
+DISCORD_MESSAGE_LIMIT = 6000  # summed over every embed in one message
+DISCORD_EMBEDS_PER_MESSAGE = 10
+TELEGRAM_CAPTION_LIMIT = 1024  # counted after HTML parsing, so tags are free
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+DEFAULT_DISCORD_TEMPLATE = "{text}"
+DEFAULT_TELEGRAM_TEMPLATE = "<b>PW team</b>\nNotification time: <i>{time}</i>\n{batches_line}\n<b>{text}</b>"
+
+# Rendered payloads kept for reuse, keyed by (renderer, announcement)
+MEMO_SIZE = 2048
+
+_TAG = re.compile(r"<[^>]+>")
+_TAG_NAME = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9-]*)[^>]*>")
+
+
+def visible_length(markup):
+    """Length of Telegram HTML as Telegram counts it: tags dropped, entities as one character."""
+    return len(html.unescape(_TAG.sub("", markup)))
+
+def split_first(text, limit):
+    """
+    Splits text into (head, rest) with len(head) <= limit, cutting at the
+    last paragraph break, else line break, else space in the second half of
+    the window, else hard at the limit. Same input, same cut.
+    """
+    if len(text) <= limit:
+        return text, ""
+    if limit <= 0:
+        return "", text
+    window = text[:limit + 1]
+    for sep in ("\n\n", "\n", " "):
+        cut = window.rfind(sep)
+        if cut >= limit // 2:
+            return text[:cut].rstrip(), text[cut + len(sep):].lstrip()
+    return text[:limit], text[limit:]
+
+def split_text(text, limit):
+    """Splits text into chunks of at most `limit` characters (see split_first)."""
+    chunks = []
+    while True:
+        head, text = split_first(text, limit)
+        chunks.append(head)
+        if not text:
+            return chunks
+
+
+class CompiledTemplate:
+    """
+    A str.format-style template parsed once. Fields: {text}, {time},
+    {batch}, {batches}, {batches_line}, {id}. Unknown fields raise
+    ValueError when compiling, not when sending.
+    """
+
+    FIELDS = ("text", "time", "batch", "batches", "batches_line", "id")
+
+    def __init__(self, source):
+        self.source = source
+        self._parts = []  # (literal, field name or None)
+        for literal, field, spec, conversion in string.Formatter().parse(source):
+            if field is not None and (field not in self.FIELDS or spec or conversion):
+                raise ValueError(f"unsupported template field {{{field}}} (use {', '.join(self.FIELDS)})")
+            self._parts.append((literal, field))
+
+    def render(self, values):
+        return "".join(literal + (values[field] if field else "") for literal, field in self._parts)
+
+    def literal_before(self, name):
+        """The template's fixed text up to the first {name} (the whole template if it has none)."""
+        literals = []
+        for literal, field in self._parts:
+            literals.append(literal)
+            if field == name:
+                break
+        return "".join(literals)
+
+
+class Renderer:
+    """
+    Turns an Announcement into a platform payload with a template compiled
+    once. Results are memoized per (renderer, announcement), so fan-out to
+    several sinks and accounts with the same template formats each
+    announcement once. Returned payloads are shared: copy before changing them.
+    """
+
+    platform = None
+    default_template = None
+
+    def __init__(self, template=None):
+        self.template = CompiledTemplate(template or self.default_template)
+        self.key = (self.platform, self.template.source)
+
+    def render(self, announcement):
+        announcement = Announcement.coerce(announcement)
+        # Everything the templates can show besides the text, which is fixed per _id
+        key = (self.key, announcement.id, announcement.batch_slug, tuple(announcement.batch_slugs))
+        with _memo_lock:
+            if key in _memo:
+                _memo.move_to_end(key)
+                return _memo[key]
+        rendered = self._render(announcement)
+        with _memo_lock:
+            _memo[key] = rendered
+            while len(_memo) > MEMO_SIZE:
+                _memo.popitem(last=False)
+        return rendered
+
+    def _render(self, announcement):
+        raise NotImplementedError
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def color_for(announcement_id):
+    """A stable embed color per announcement, so retries and re-renders look the same."""
+    return int(hashlib.sha1((announcement_id or "").encode()).hexdigest()[:6], 16)
+
+def embed_length(embed):
+    """Characters Discord counts towards the per-message limit."""
+    total = len(embed.get("description") or "") + len((embed.get("author") or {}).get("name") or "")
+    for field in embed.get("fields") or ():
+        total += len(field["name"]) + len(field["value"])
+    return total
+
+
+class DiscordRenderer(Renderer):
+    """Renders to a list of embeds: one, or more when the text exceeds an embed's description limit."""
+
+    platform = "discord"
+    default_template = DEFAULT_DISCORD_TEMPLATE
+    # Leaves room for the author and fields within the per-message limit
+    CHUNK = DISCORD_DESCRIPTION_LIMIT - 96
+
+    def _render(self, ann):
+        batches = ", ".join(ann.batch_slugs)
+        values = {
+            "text": ann.text or "New Announcement",
+            "time": ann.notification_time(),
+            "batch": ann.batch_slug or "",
+            "batches": batches,
+            "batches_line": f"Batches: {batches}\n" if len(ann.batch_slugs) > 1 else "",
+            "id": ann.id or "",
+        }
+        chunks = split_text(self.template.render(values), self.CHUNK)
+        color = color_for(ann.id)
+        first = {
+            "author": {"name": "PW team", "icon_url": PW_LOGO_URL},
+            "description": chunks[0],
+            "color": color,
+            "fields": [{"name": "Notification Time", "value": values["time"], "inline": False}],
+        }
+        # Same notice posted to several batches, collapsed by core.dedup
+        if len(ann.batch_slugs) > 1:
+            value, _ = split_first(batches, DISCORD_FIELD_LIMIT)
+            first["fields"].append({"name": "Batches", "value": value, "inline": False})
+        image_url = ann.attachment.url if ann.attachment else None
+        if image_url:
+            first["image"] = {"url": image_url}
+        return [first] + [{"description": chunk, "color": color} for chunk in chunks[1:]]
+
+
+def group_embeds(embeds):
+    """Packs embeds, in order, into as few messages as Discord's count and size limits allow."""
+    messages, current, size = [], [], 0
+    for embed in embeds:
+        length = embed_length(embed)
+        if current and (len(current) >= DISCORD_EMBEDS_PER_MESSAGE or size + length > DISCORD_MESSAGE_LIMIT):
+            messages.append(current)
+            current, size = [], 0
+        current.append(embed)
+        size += length
+    if current:
+        messages.append(current)
+    return messages
+
+
+class TelegramRenderer(Renderer):
+    """
+    Renders to {"photo", "caption", "followups"}. The caption is cut to fit
+    TELEGRAM_CAPTION_LIMIT; any remaining text goes in follow-up messages of
+    at most TELEGRAM_MESSAGE_LIMIT characters, inside whatever tags the
+    template has open at {text}.
+    """
+
+    platform = "telegram"
+    default_template = DEFAULT_TELEGRAM_TEMPLATE
+
+    def __init__(self, template=None):
+        super().__init__(template)
+        # Follow-ups carry on the text with the formatting the template puts around {text}
+        opened = []
+        for match in _TAG_NAME.finditer(self.template.literal_before("text")):
+            closing, name = match.group(1), match.group(2).lower()
+            if not closing:
+                opened.append((name, match.group(0)))
+            elif opened and opened[-1][0] == name:
+                opened.pop()
+        self.text_open = "".join(tag for _, tag in opened)
+        self.text_close = "".join(f"</{name}>" for name, _ in reversed(opened))
+
+    def values(self, ann, text):
+        batches = html.escape(", ".join(ann.batch_slugs))
+        return {
+            "text": html.escape(text),
+            "time": html.escape(ann.notification_time()),
+            "batch": html.escape(ann.batch_slug or ""),
+            "batches": batches,
+            "batches_line": f"Batches: <i>{batches}</i>\n" if len(ann.batch_slugs) > 1 else "",
+            "id": html.escape(ann.id or ""),
+        }
+
+    def format(self, announcement):
+        """The whole message as one string, however long."""
+        ann = Announcement.coerce(announcement)
+        return self.template.render(self.values(ann, ann.text or "New Announcement"))
+
+    def _render(self, ann):
+        text = ann.text or "New Announcement"
+        # Escaped text is as long as the raw text once Telegram parses it
+        budget = TELEGRAM_CAPTION_LIMIT - visible_length(self.template.render(self.values(ann, "")))
+        head, rest = split_first(text, max(0, budget))
+        caption = self.template.render(self.values(ann, head))
+        if visible_length(caption) > TELEGRAM_CAPTION_LIMIT:
+            # The template alone doesn't fit; send the text on its own
+            head, rest = split_first(text, TELEGRAM_CAPTION_LIMIT)
+            caption = html.escape(head)
+            logging.warning(f"Telegram template is longer than a caption; sent {ann.id} without it.")
+        followups = [
+            self.text_open + html.escape(chunk) + self.text_close for chunk in split_text(rest, TELEGRAM_MESSAGE_LIMIT)
+        ] if rest else []
+        image_url = ann.attachment.url if ann.attachment else None
+        return {"photo": image_url or PW_LOGO_URL, "caption": caption, "followups": followups}
+
+
+def build_renderer(cls, template):
+    """A renderer for a configured template, falling back to the default if it doesn't compile."""
+    try:
+        return cls(template)
+    except ValueError as e:
+        logging.error(f"Invalid {cls.platform} template ({e}); using the default.")
+        return cls()
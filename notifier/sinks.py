@@ -0,0 +1,240 @@
+# notifier/sinks.py
+
+import hashlib
+import logging
+from collections import OrderedDict
+from core.attachments import read_file, discord_ref_expiry
+from notifier.dispatcher import TokenBucket, SENT, RETRY, REJECTED
+from notifier.render import DiscordRenderer, TelegramRenderer, build_renderer, group_embeds
+from notifier.discord_noti import (
+    build_discord_embeds, post_discord_embeds, MAX_EMBEDS_PER_MESSAGE, MAX_FILES_PER_MESSAGE, PW_LOGO_URL,
+)
+from notifier.telegram_noti import (
+    build_telegram_photo_payload, build_telegram_followups, post_telegram_photo, post_telegram_message,
+)
+
+
+class Sink:
+    """
+    A notification destination. Subclasses set `name` (the outbox key, so it
+    must stay stable), `max_batch` (announcements per send) and implement
+    send_pack. Each sink owns its own TokenBucket, so one platform's limits
+    never slow another.
+    """
+
+    name = None
+    max_batch = 1
+    MAX_429_RETRIES = 5
+    # Packs whose split send stopped part way, remembered for the retry
+    MAX_PARTIAL = 256
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self._partial = OrderedDict()  # pack key -> steps already accepted
+
+    def send_pack(self, pack):
+        """Sends `pack` (one or more platform requests). Returns the last raw response."""
+        raise NotImplementedError
+
+    def _send_steps(self, key, steps):
+        """
+        Runs request callables in order, each after the first taking its own
+        bucket token. Returns the first failed response, else the last one.
+        When a text had to be split over several requests and one fails, the
+        retry of the same pack resumes after the parts already accepted
+        instead of posting them again.
+        """
+        done = self._partial.pop(key, 0)
+        response = None
+        for i in range(done, len(steps)):
+            if response is not None:
+                self.bucket.update_from_headers(response.headers)
+                self.bucket.acquire()
+            response = steps[i]()
+            if not response.ok:
+                if i:
+                    self._partial[key] = i
+                    while len(self._partial) > self.MAX_PARTIAL:
+                        self._partial.popitem(last=False)
+                return response
+        return response
+
+    def retry_after(self, response):
+        """Seconds to wait after a 429."""
+        try:
+            return float(response.headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            return 1.0
+
+    def deliver(self, pack):
+        """
+        Sends `pack`, waiting out 429s. Returns SENT once the platform
+        accepted it, REJECTED for any other 4xx, else RETRY.
+        """
+        for _ in range(self.MAX_429_RETRIES + 1):
+            self.bucket.acquire()
+            response = self.send_pack(pack)
+            self.bucket.update_from_headers(response.headers)
+            if response.status_code != 429:
+                if response.ok:
+                    logging.info(f"Sent {len(pack)} announcement(s) to {self.name}.")
+                    return SENT
+                if 400 <= response.status_code < 500:
+                    logging.warning(f"{self.name} rejected {len(pack)} announcement(s): {response.status_code} {response.text[:200]}")
+                    return REJECTED
+                return RETRY
+            wait = self.retry_after(response)
+            logging.warning(f"{self.name} rate limited; retrying in {wait:.1f}s.")
+            self.bucket.block_for(wait)
+        return RETRY
+
+
+class DiscordSink(Sink):
+    name = "discord"
+    max_batch = MAX_EMBEDS_PER_MESSAGE
+
+    def __init__(self, webhook_url, bucket=None, attachments=None, renderer=None):
+        # Discord webhooks default to 5 requests per 2s; real limits come from headers
+        super().__init__(bucket or TokenBucket(capacity=5, per=2.0))
+        self.webhook_url = webhook_url
+        self.renderer = renderer or DiscordRenderer()
+        # Optional core.attachments.AttachmentCache: images are uploaded once, then their CDN URL is reused
+        self.attachments = attachments
+        if attachments:
+            attachments.prefetch([PW_LOGO_URL])
+
+    def _use_cached_images(self, embeds):
+        """
+        Points embed images (and the author icon) at an earlier upload's CDN
+        URL, or at a file uploaded with this message. Returns the changed
+        copies of the embeds and the files to upload as
+        {filename: (sha, bytes, content_type)}.
+        """
+        uploads = {}
+        # Rendered embeds are shared with the render cache
+        embeds = [dict(embed) for embed in embeds]
+        for embed in embeds:
+            for part, key in (("image", "url"), ("author", "icon_url")):
+                holder = embed.get(part)
+                if not holder or not holder.get(key):
+                    continue
+                holder = embed[part] = dict(holder)
+                ref, cached = self.attachments.resolve(holder[key], self.name)
+                if ref:
+                    holder[key] = ref
+                elif cached and (cached.filename in uploads or len(uploads) < MAX_FILES_PER_MESSAGE):
+                    if cached.filename not in uploads:
+                        data = read_file(cached)
+                        if data is None:
+                            continue
+                        uploads[cached.filename] = (cached.sha, data, cached.content_type)
+                    holder[key] = f"attachment://{cached.filename}"
+        return embeds, uploads
+
+    def send_pack(self, pack):
+        # Long texts become several embeds, so a pack can need more than one message
+        embeds = [embed for ann in pack for embed in build_discord_embeds(ann, self.renderer)]
+        messages = group_embeds(embeds)
+        key = tuple(ann.id for ann in pack)
+        return self._send_steps(key, [lambda message=message: self._post(message) for message in messages])
+
+    def _post(self, embeds):
+        if not self.attachments:
+            return post_discord_embeds(self.webhook_url, embeds)
+        embeds, uploads = self._use_cached_images(embeds)
+        files = [(name, data, content_type) for name, (_, data, content_type) in uploads.items()]
+        response = post_discord_embeds(self.webhook_url, embeds, files=files)
+        if uploads and response.ok:
+            self._remember_uploads(response, uploads)
+        return response
+
+    def _remember_uploads(self, response, uploads):
+        try:
+            attachments = response.json().get("attachments") or []
+        except ValueError:
+            return
+        for att in attachments:
+            upload = uploads.get(att.get("filename"))
+            if upload and att.get("url"):
+                self.attachments.set_ref(upload[0], self.name, att["url"], discord_ref_expiry(att["url"]))
+
+    def retry_after(self, response):
+        try:
+            return float(response.json().get("retry_after"))
+        except Exception:
+            return super().retry_after(response)
+
+
+class TelegramSink(Sink):
+    name = "telegram"
+    # sendPhoto carries one announcement per message
+    max_batch = 1
+
+    def __init__(self, bot_token, chat_id, bucket=None, attachments=None, renderer=None):
+        # Telegram allows about one message per second to the same chat
+        super().__init__(bucket or TokenBucket(capacity=1, per=1.0))
+        self.bot_token = bot_token
+        self.chat_id = chat_id
+        self.renderer = renderer or TelegramRenderer()
+        # Optional core.attachments.AttachmentCache: each image is uploaded once, then sent by file_id
+        self.attachments = attachments
+        # file_ids only work for the bot that uploaded the file
+        self._ref_key = "telegram:" + hashlib.sha1(bot_token.encode()).hexdigest()[:12]
+        if attachments:
+            attachments.prefetch([PW_LOGO_URL])
+
+    def send_pack(self, pack):
+        ann = pack[0]
+        # Text past the caption limit follows as plain messages
+        steps = [lambda: self._send_photo(ann)] + [
+            lambda payload=payload: post_telegram_message(self.bot_token, payload)
+            for payload in build_telegram_followups(self.chat_id, ann, self.renderer)
+        ]
+        return self._send_steps((ann.id,), steps)
+
+    def _send_photo(self, ann):
+        payload = build_telegram_photo_payload(self.chat_id, ann, self.renderer)
+        if not self.attachments:
+            return post_telegram_photo(self.bot_token, payload)
+        ref, cached = self.attachments.resolve(payload["photo"], self._ref_key)
+        data = read_file(cached) if cached and not ref else None
+        if ref:
+            payload["photo"] = ref
+        response = post_telegram_photo(
+            self.bot_token, payload,
+            photo_file=(cached.filename, data, cached.content_type) if data is not None else None,
+        )
+        if data is not None and response.ok:
+            try:
+                file_id = response.json()["result"]["photo"][-1]["file_id"]
+            except (ValueError, KeyError, IndexError, TypeError):
+                file_id = None
+            if file_id:
+                self.attachments.set_ref(cached.sha, self._ref_key, file_id)
+        elif ref and response.status_code == 400:
+            # e.g. "wrong file identifier": upload again on the retry
+            self.attachments.forget_ref(cached.sha, self._ref_key)
+        return response
+
+    def retry_after(self, response):
+        try:
+            return float(response.json()["parameters"]["retry_after"])
+        except Exception:
+            return super().retry_after(response)
+
+
+def build_sinks(cfg, attachments=None):
+    """
+    Returns a Sink for every notification target filled in an account config,
+    each with its message template (discord_template / telegram_template)
+    compiled once.
+    """
+    sinks = []
+    webhook_url = cfg.get("webhook_url")
+    if webhook_url and not webhook_url.startswith("YOUR_"):
+        renderer = build_renderer(DiscordRenderer, cfg.get("discord_template"))
+        sinks.append(DiscordSink(webhook_url, attachments=attachments, renderer=renderer))
+    if cfg.get("telegram_bot_token") and cfg.get("telegram_chat_id"):
+        renderer = build_renderer(TelegramRenderer, cfg.get("telegram_template"))
+        sinks.append(TelegramSink(cfg["telegram_bot_token"], cfg["telegram_chat_id"], attachments=attachments, renderer=renderer))
+    return sinks
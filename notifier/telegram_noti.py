@@ -1,69 +1,83 @@
 # notifier/telegram_noti.py
 
-import requests
-from datetime import datetime
-import random
+import os
+from core.http import request
+from core.models import Announcement
+from notifier.render import TelegramRenderer, PW_LOGO_URL
+
+TELEGRAM_API_URL = os.environ.get("PW_TELEGRAM_API_URL", "https://api.telegram.org")
+
+DEFAULT_RENDERER = TelegramRenderer()
 
 def format_announcement_message(announcement):
     """
-    Formats the announcement for Telegram using Markdown.
+    Formats the announcement for Telegram using HTML.
     Shows PW Team as sender, notification time, and announcement text.
+    Returns the whole message, which may be longer than a caption allows.
     """
-    description = announcement.get("announcement", "New Announcement")
+    return DEFAULT_RENDERER.format(announcement), PW_LOGO_URL
 
-    # Format notification time
-    try:
-        dt = datetime.fromisoformat(announcement.get("scheduleTime", "")[:-1])
-        notification_time = dt.strftime("%d %b %Y, %I:%M %p")
-    except Exception:
-        notification_time = announcement.get("scheduleTime", "")
+def build_telegram_photo_payload(chat_id, announcement, renderer=None):
+    """
+    Builds the sendPhoto payload for one announcement: the attachment image
+    (or the PW logo if there is none) with the formatted message as caption,
+    cut to Telegram's caption limit. The rest of a long text is in
+    build_telegram_followups.
+    """
+    rendered = (renderer or DEFAULT_RENDERER).render(announcement)
+    # Use sendPhoto to show image and caption together (with HTML formatting)
+    return {
+        "chat_id": chat_id,
+        "photo": rendered["photo"],
+        "caption": rendered["caption"],
+        "parse_mode": "HTML"
+    }
 
-    # PW Team header with logo
-    pw_logo = "https://www.pw.live/study/assets/icons/logo.png"
-    header = f"<b>PW team</b>\nNotification time: <i>{notification_time}</i>\n"
+def build_telegram_followups(chat_id, announcement, renderer=None):
+    """sendMessage payloads for the text that didn't fit in the caption (usually none)."""
+    rendered = (renderer or DEFAULT_RENDERER).render(announcement)
+    return [{"chat_id": chat_id, "text": text, "parse_mode": "HTML"} for text in rendered["followups"]]
 
-    # Main message body
-    message = f"{header}\n<b>{description}</b>"
+def post_telegram_photo(bot_token, payload, photo_file=None):
+    """
+    Calls sendPhoto with a prepared payload. If `photo_file` (filename,
+    bytes, content_type) is given it is uploaded as the photo instead of the
+    payload's URL/file_id. Returns the raw response so callers can read a
+    429's retry_after, or the new file_id.
+    """
+    url = f"{TELEGRAM_API_URL}/bot{bot_token}/sendPhoto"
+    if photo_file is not None:
+        data = {k: v for k, v in payload.items() if k != "photo"}
+        return request("POST", url, "telegram_send_photo", data=data, files={"photo": photo_file}, timeout=60)
+    return request("POST", url, "telegram_send_photo", data=payload, timeout=30)
 
-    return message, pw_logo
+def post_telegram_message(bot_token, payload):
+    """Calls sendMessage with a prepared payload. Returns the raw response."""
+    url = f"{TELEGRAM_API_URL}/bot{bot_token}/sendMessage"
+    return request("POST", url, "telegram_send_message", data=payload, timeout=30)
 
 def send_telegram_announcement(bot_token, chat_id, announcement):
     """
-    Sends a single announcement to Telegram using sendPhoto (if image) or sendMessage.
+    Sends a single announcement to Telegram using sendPhoto, then sendMessage for any text beyond the caption.
     :param bot_token: Telegram bot token (string)
     :param chat_id: Telegram chat ID (int or string)
-    :param announcement: dict with keys: 'announcement', 'scheduleTime', 'attachment' (dict or None)
+    :param announcement: core.models.Announcement (a plain API-shaped dict also works)
     """
-    message, pw_logo = format_announcement_message(announcement)
-
-    # Prepare image URL if available
-    image_url = None
-    attachment = announcement.get("attachment")
-    if attachment and attachment.get("baseUrl") and attachment.get("key"):
-        image_url = attachment["baseUrl"].rstrip("/") + "/" + attachment["key"].lstrip("/")
-    else:
-        image_url = pw_logo  # Always show PW logo as image if no attachment
-
-    # Telegram API endpoint
-    url = f"https://api.telegram.org/bot{bot_token}/sendPhoto"
-
-    # Use sendPhoto to show image and caption together (with HTML formatting)
-    payload = {
-        "chat_id": chat_id,
-        "photo": image_url,
-        "caption": message,
-        "parse_mode": "HTML"
-    }
-    response = requests.post(url, data=payload)
-    return response.ok
+    if not post_telegram_photo(bot_token, build_telegram_photo_payload(chat_id, announcement)).ok:
+        return False
+    for payload in build_telegram_followups(chat_id, announcement):
+        if not post_telegram_message(bot_token, payload).ok:
+            return False
+    return True
 
 def send_telegram_announcements(bot_token, chat_id, announcements):
     """
     Sends multiple announcements one by one to Telegram in chronological order (oldest first).
     """
     results = []
-    # Sort by scheduleTime so oldest is first, latest is last
-    for announcement in sorted(announcements, key=lambda x: x.get("scheduleTime", "")):
+    # Sort by posting time so oldest is first, latest is last
+    announcements = [Announcement.coerce(ann) for ann in announcements]
+    for announcement in sorted(announcements, key=Announcement.sort_key):
         result = send_telegram_announcement(bot_token, chat_id, announcement)
         results.append(result)
     return results